@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+import numpy as np
+import typer
+from typer import Typer
+
+from synchrotron.nodes import Node, RenderContext, get_node_types
+from synchrotron.nodes.core import DataNode
+from synchrotron.offline import PlaybackCaptureNode
+from synchrotron.synchrotron import Synchrotron
+
+EXAMPLES_DIRECTORY = Path(__file__).parent.parent / 'examples'
+# These open hardware devices as soon as they're created, so can't be benchmarked headless
+HARDWARE_NODE_TYPES = {'PlaybackNode', 'MidiInputNode'}
+# Data inputs which node types can't render without. Paths are to fixtures written by write_fixtures.
+NODE_DATA_INPUTS = {
+    'SequenceNode': {'sequence': [440, 660, 880]},
+    'FilePlayerNode': {'path': 'fixture.wav', 'loop': True},
+    'SampleNode': {'path': 'fixture.wav'},
+    'MidiFileNode': {'path': 'fixture.mid', 'loop': True},
+}
+# Run in a fresh interpreter so that module imports and on-disk caches are measured the way a new process sees them
+STARTUP_SCRIPT = """
+import time
+start_time = time.perf_counter()
+from synchrotron.synchrotron import Synchrotron
+import_time = time.perf_counter()
+Synchrotron().execute('new 440 frequency; new SineNode sine; link frequency.out -> sine.frequency')
+print(import_time - start_time, time.perf_counter() - import_time)
+"""
+
+cli = Typer()
+
+
+def headless_synchrotron(sample_rate: int, buffer_size: int) -> Synchrotron:
+    # Not realtime, so nodes which stream to or from disk wait on it rather than dropping audio
+    synchrotron = Synchrotron(sample_rate=sample_rate, buffer_size=buffer_size, realtime=False)
+    # Capture nodes with no file open stand in for PlaybackNode, discarding the rendered audio
+    synchrotron.node_types['PlaybackNode'] = PlaybackCaptureNode
+    return synchrotron
+
+
+def benchmark_example(path: Path, blocks: int, warmup_blocks: int, sample_rate: int, buffer_size: int) -> dict:
+    synchrotron = headless_synchrotron(sample_rate, buffer_size)
+    try:
+        synchrotron.execute(path.read_text())
+        # Shutting down removes every node, so count them beforehand
+        node_count = len(synchrotron.nodes)
+        for _ in range(warmup_blocks):
+            synchrotron.render_graph()
+
+        start_time = time.perf_counter()
+        for _ in range(blocks):
+            synchrotron.render_graph()
+        elapsed = time.perf_counter() - start_time
+    finally:
+        synchrotron.shutdown()
+
+    audio_duration = blocks * buffer_size / sample_rate
+    return {
+        'nodes': node_count,
+        'blocks': blocks,
+        'buffer_size': buffer_size,
+        'seconds': elapsed,
+        'block_microseconds': elapsed / blocks * 1e6,
+        'realtime_factor': audio_duration / elapsed,
+    }
+
+
+def write_fixtures(directory: Path, sample_rate: int) -> None:
+    from soundfile import write
+
+    noise = np.random.default_rng(0).uniform(-0.5, 0.5, size=(10 * sample_rate, 2)).astype(np.float32)
+    write(directory / 'fixture.wav', noise, sample_rate, subtype='FLOAT')
+
+    # A note every sixteenth for 20 beats, each held until the next starts
+    track = b''
+    for step in range(80):
+        note = 48 + step % 24
+        track += b'\x00' + bytes((0x90, note, 100)) + b'\x78' + bytes((0x80, note, 0))
+    track += b'\x00\xff\x2f\x00'
+    # Six byte header of format 0, one track and 480 ticks per beat
+    header = b'MThd' + (6).to_bytes(4, 'big') + bytes((0, 0, 0, 1, 0x01, 0xe0))
+    (directory / 'fixture.mid').write_bytes(header + b'MTrk' + len(track).to_bytes(4, 'big') + track)
+
+
+def benchmark_startup(repeat: int) -> dict:
+    timings = np.array([
+        [float(value) for value in subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT], capture_output=True, text=True, check=True,
+        ).stdout.split()]
+        for _ in range(repeat)
+    ])
+    import_seconds, construct_seconds = np.median(timings, axis=0)
+    return {
+        'repeat': repeat,
+        'import_microseconds': import_seconds * 1e6,
+        'construct_microseconds': construct_seconds * 1e6,
+    }
+
+
+def benchmark_node(node_type: type[Node], repeat: int, sample_rate: int, buffer_size: int) -> dict:
+    synchrotron = headless_synchrotron(sample_rate, buffer_size)
+    try:
+        if issubclass(node_type, DataNode):
+            node = node_type(synchrotron=synchrotron, name='benchmark', value=1.)
+        else:
+            node = node_type(synchrotron=synchrotron, name='benchmark')
+        for input_name, value in NODE_DATA_INPUTS.get(node_type.__name__, {}).items():
+            node.get_input(input_name).buffer = value
+
+        ctx = RenderContext(
+            global_clock=0,
+            sample_rate=sample_rate,
+            buffer_size=buffer_size,
+            arena=synchrotron.buffer_arena,
+        )
+        timings = np.empty(repeat)
+        for i in range(repeat):
+            start_time = time.perf_counter()
+            node.render(ctx)
+            timings[i] = time.perf_counter() - start_time
+            synchrotron.buffer_arena.release_all()
+            ctx.global_clock += buffer_size
+        node.teardown()
+    finally:
+        synchrotron.shutdown()
+
+    return {
+        'buffer_size': buffer_size,
+        'repeat': repeat,
+        'mean_microseconds': timings.mean() * 1e6,
+        'median_microseconds': float(np.median(timings)) * 1e6,
+        'nanoseconds_per_sample': timings.mean() / buffer_size * 1e9,
+        'realtime_factor': buffer_size / sample_rate / timings.mean(),
+    }
+
+
+@cli.command()
+def run(
+    output: Path = typer.Option(Path('benchmark.json'), help='File to write the JSON results to'),
+    blocks: int = typer.Option(2000, help='Blocks to render for each example script'),
+    repeat: int = typer.Option(500, help='Renders to time for each node type and buffer size'),
+    buffer_sizes: list[int] = typer.Option([64, 256, 1024, 4096], '--buffer-size', help='Node benchmark buffer sizes'),
+    startup_repeat: int = typer.Option(5, help='Fresh interpreters to time startup in'),
+    sample_rate: int = 44100,
+    buffer_size: int = 256,
+):
+    """Benchmark the example scripts and every node type, saving the results as JSON."""
+    results = {
+        'version': _package_version(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'sample_rate': sample_rate,
+        'startup': benchmark_startup(repeat=startup_repeat),
+        'examples': {},
+        'nodes': {},
+    }
+    typer.echo(f'{"startup":<24} {results["startup"]["import_microseconds"] / 1e3:>10.1f}ms import '
+               f'{results["startup"]["construct_microseconds"] / 1e3:>8.1f}ms construct and first script')
+
+    for path in sorted(EXAMPLES_DIRECTORY.glob('*.syn')):
+        try:
+            result = benchmark_example(path, blocks, warmup_blocks=blocks // 10, sample_rate=sample_rate,
+                                       buffer_size=buffer_size)
+        except Exception as error:  # noqa: BLE001
+            result = {'error': f'{error.__class__.__name__}: {error}'}
+            typer.echo(f'{path.name:<24} {result["error"]}')
+        else:
+            typer.echo(f'{path.name:<24} {result["block_microseconds"]:>10.1f}us/block '
+                       f'{result["realtime_factor"]:>8.1f}x realtime')
+        results['examples'][path.stem] = result
+
+    # Some node types write files as soon as they're created, so keep those out of the working directory
+    with tempfile.TemporaryDirectory() as directory, _working_directory(Path(directory)):
+        write_fixtures(Path(directory), sample_rate)
+        for node_type in get_node_types():
+            if node_type.__name__ in HARDWARE_NODE_TYPES:
+                continue
+
+            node_results = results['nodes'][node_type.__name__] = {}
+            for size in buffer_sizes:
+                try:
+                    result = benchmark_node(node_type, repeat, sample_rate=sample_rate, buffer_size=size)
+                except Exception as error:  # noqa: BLE001
+                    result = {'error': f'{error.__class__.__name__}: {error}'}
+                    typer.echo(f'{node_type.__name__:<24} {size:>5} {result["error"]}')
+                else:
+                    typer.echo(f'{node_type.__name__:<24} {size:>5} {result["mean_microseconds"]:>10.1f}us '
+                               f'{result["nanoseconds_per_sample"]:>8.1f}ns/sample')
+                node_results[str(size)] = result
+
+    output.write_text(json.dumps(results, indent=2))
+    typer.echo(f'Results written to {output}')
+
+
+@cli.command()
+def compare(
+    baseline: Path,
+    candidate: Path,
+    threshold: float = typer.Option(0.1, help='Relative slowdown to report as a regression'),
+):
+    """Compare two benchmark result files, listing regressions beyond the threshold."""
+    baseline_results = json.loads(baseline.read_text())
+    candidate_results = json.loads(candidate.read_text())
+    regressions = 0
+
+    def report(name: str, before: float, after: float) -> None:
+        nonlocal regressions
+        change = after / before - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        typer.echo(f'{name:<40} {before:>10.1f}us -> {after:>10.1f}us {change:>+8.1%}{flag}')
+
+    for name, after in candidate_results.get('startup', {}).items():
+        before = baseline_results.get('startup', {}).get(name)
+        if name.endswith('_microseconds') and before is not None:
+            report(f'startup {name.removesuffix("_microseconds")}', before, after)
+
+    for name, result in candidate_results['examples'].items():
+        before = baseline_results['examples'].get(name, {})
+        if 'block_microseconds' in result and 'block_microseconds' in before:
+            report(name, before['block_microseconds'], result['block_microseconds'])
+
+    for node_type, sizes in candidate_results['nodes'].items():
+        for size, result in sizes.items():
+            before = baseline_results['nodes'].get(node_type, {}).get(size, {})
+            if 'mean_microseconds' in result and 'mean_microseconds' in before:
+                report(f'{node_type} [{size}]', before['mean_microseconds'], result['mean_microseconds'])
+
+    if regressions:
+        typer.echo(f'{regressions} regression{"s" if regressions != 1 else ""} found')
+        raise typer.Exit(code=1)
+
+
+def _package_version() -> str:
+    try:
+        return version('synchrotron')
+    except PackageNotFoundError:
+        return 'unknown'
+
+
+@contextlib.contextmanager
+def _working_directory(path: Path):
+    previous_directory = Path.cwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous_directory)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import abc
+from collections import deque
+from threading import Condition, Event, Thread
+from time import perf_counter, sleep
+from typing import TYPE_CHECKING, ClassVar
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from numpy.typing import NDArray
+    from pyaudio import PyAudio
+
+    # Fills a preallocated (frames, channels) float32 buffer, which is laid out as interleaved samples
+    OutputCallback = Callable[[NDArray[np.float32]], None]
+
+
+class OutputStream(abc.ABC):
+    def __init__(self, sample_rate: int, channels: int, buffer_size: int, callback: OutputCallback) -> None:
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.buffer_size = buffer_size
+        self.callback = callback
+        # Reused for every callback, so the audio thread never allocates
+        self.buffer = np.zeros(shape=(buffer_size, channels), dtype=np.float32)
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} ({self.channels} channels, {self.sample_rate}Hz)>'
+
+    @abc.abstractmethod
+    def close(self) -> None:
+        pass
+
+
+class AudioBackend(abc.ABC):
+    name: ClassVar[str]
+    # Whether the device plays on its own clock. Otherwise it waits for each block to be rendered before taking it.
+    realtime = True
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__}>'
+
+    @property
+    @abc.abstractmethod
+    def device_name(self) -> str:
+        pass
+
+    @abc.abstractmethod
+    def open_output(self, sample_rate: int, channels: int, buffer_size: int, callback: OutputCallback) -> OutputStream:
+        pass
+
+    def terminate(self) -> None:  # noqa: B027
+        pass
+
+
+class PyAudioOutputStream(OutputStream):
+    def __init__(
+        self, session: PyAudio, sample_rate: int, channels: int, buffer_size: int, callback: OutputCallback,
+    ) -> None:
+        super().__init__(sample_rate, channels, buffer_size, callback)
+        from pyaudio import paContinue, paFloat32
+
+        self._pyaudio_continue = paContinue
+        # noinspection PyTypeChecker
+        self.stream = session.open(
+            rate=sample_rate,
+            channels=channels,
+            format=paFloat32,
+            output=True,
+            frames_per_buffer=buffer_size,
+            stream_callback=self._pyaudio_callback,
+        )
+
+    def _pyaudio_callback(self, *_):
+        # PyAudio copies the returned samples to the device, so the buffer can be handed straight back
+        self.callback(self.buffer)
+        return self.buffer, self._pyaudio_continue
+
+    def close(self) -> None:
+        self.stream.close()
+
+
+class PyAudioBackend(AudioBackend):
+    name = 'pyaudio'
+
+    def __init__(self) -> None:
+        self._session: PyAudio | None = None
+
+    @property
+    def session(self) -> PyAudio:
+        # Opened on first use, as initialising PortAudio is slow and pointless if nothing is ever played
+        if self._session is None:
+            from pyaudio import PyAudio
+
+            self._session = PyAudio()
+        return self._session
+
+    @property
+    def device_name(self) -> str:
+        return self.session.get_default_output_device_info().get('name')
+
+    def open_output(self, sample_rate: int, channels: int, buffer_size: int, callback: OutputCallback) -> OutputStream:
+        return PyAudioOutputStream(self.session, sample_rate, channels, buffer_size, callback)
+
+    def terminate(self) -> None:
+        if self._session is not None:
+            self._session.terminate()
+            self._session = None
+
+
+class TimerOutputStream(OutputStream):
+    # Calls back from its own thread every buffer period, like a sound card would. Deadlines are absolute, so timing
+    # errors don't accumulate; if the callback falls more than a period behind, the clock skips ahead rather than
+    # bursting to catch up. Without realtime, it calls back again as soon as the last callback returns.
+    def __init__(
+        self, sample_rate: int, channels: int, buffer_size: int, callback: OutputCallback, realtime: bool = True,
+    ) -> None:
+        super().__init__(sample_rate, channels, buffer_size, callback)
+        self.realtime = realtime
+        self.period = buffer_size / sample_rate
+        self.callback_count = 0
+        self.late_callbacks = 0
+        self._stop_event = Event()
+        self._thread = Thread(target=self._run, name='AudioClock', daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        deadline = perf_counter()
+        while not self._stop_event.is_set():
+            self.callback(self.buffer)
+            self.consume(self.buffer)
+            self.callback_count += 1
+            if not self.realtime:
+                continue
+
+            deadline += self.period
+            delay = deadline - perf_counter()
+            if delay > 0:
+                sleep(delay)
+            elif delay < -self.period:
+                self.late_callbacks += 1
+                deadline = perf_counter()
+
+    def consume(self, buffer: NDArray[np.float32]) -> None:
+        # Where a real device would play the buffer
+        pass
+
+    def close(self) -> None:
+        self._stop_event.set()
+        self._thread.join()
+
+
+class NullBackend(AudioBackend):
+    # Discards all audio, for machines without a sound card. Rendering is still paced by a real-time clock unless
+    # realtime is disabled, in which case each callback waits for the next rendered block, so the device takes blocks
+    # exactly as fast as the graph renders them.
+    name = 'null'
+
+    def __init__(self, realtime: bool = True) -> None:
+        self.realtime = realtime
+
+    @property
+    def device_name(self) -> str:
+        return 'Null Output'
+
+    def open_output(self, sample_rate: int, channels: int, buffer_size: int, callback: OutputCallback) -> OutputStream:
+        return TimerOutputStream(sample_rate, channels, buffer_size, callback, realtime=self.realtime)
+
+
+class CaptureOutputStream(TimerOutputStream):
+    def __init__(
+        self,
+        sample_rate: int,
+        channels: int,
+        buffer_size: int,
+        callback: OutputCallback,
+        realtime: bool = True,
+        max_buffers: int | None = None,
+    ) -> None:
+        self._buffers: deque[NDArray[np.float32]] = deque(maxlen=max_buffers)
+        # Counts every frame played, including those dropped from the front of a full buffer ring
+        self.frames_played = 0
+        self._captured = Condition()
+        super().__init__(sample_rate, channels, buffer_size, callback, realtime)
+
+    def consume(self, buffer: NDArray[np.float32]) -> None:
+        with self._captured:
+            self._buffers.append(buffer.copy())
+            self.frames_played += len(buffer)
+            self._captured.notify_all()
+
+    @property
+    def captured(self) -> NDArray[np.float32]:
+        with self._captured:
+            if not self._buffers:
+                return np.empty(shape=(0, self.channels), dtype=np.float32)
+            return np.concatenate(self._buffers)
+
+    def wait_for_frames(self, frames: int, timeout: float | None = None) -> bool:
+        with self._captured:
+            return self._captured.wait_for(lambda: self.frames_played >= frames, timeout)
+
+
+class CaptureBackend(NullBackend):
+    # Null device which keeps what it's played in memory, for tests and latency measurements. Only the most recent
+    # max_buffers buffers are kept per stream, so a long-running session (e.g. one started from the CLI or server,
+    # which can't pass a limit) doesn't grow without bound. Pass None to keep everything.
+    name = 'capture'
+    default_max_buffers = 4096
+
+    def __init__(self, realtime: bool = True, max_buffers: int | None = default_max_buffers) -> None:
+        super().__init__(realtime)
+        self.max_buffers = max_buffers
+        self.streams: list[CaptureOutputStream] = []
+
+    @property
+    def device_name(self) -> str:
+        return 'Capture Output'
+
+    def open_output(self, sample_rate: int, channels: int, buffer_size: int, callback: OutputCallback) -> OutputStream:
+        stream = CaptureOutputStream(sample_rate, channels, buffer_size, callback, self.realtime, self.max_buffers)
+        self.streams.append(stream)
+        return stream
+
+
+AUDIO_BACKENDS: dict[str, type[AudioBackend]] = {
+    backend.name: backend for backend in (PyAudioBackend, NullBackend, CaptureBackend)
+}
+
+
+def get_audio_backend(name: str) -> AudioBackend:
+    try:
+        return AUDIO_BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"audio backend '{name}' not found") from None
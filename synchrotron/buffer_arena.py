@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from numpy.typing import DTypeLike, NDArray
+
+    from .nodes import Output
+
+
+class BufferArena:
+    # Pool of reusable stream buffers, leased to outputs for the duration of a block. The render plan works out
+    # when every sink has consumed an output's buffer, at which point it is handed back for a later node to reuse.
+    def __init__(self) -> None:
+        self._pools: dict[tuple[tuple[int, ...], np.dtype], list[NDArray]] = {}
+        self._leases: dict[Output, NDArray] = {}
+        self.allocation_count = 0
+
+    def __repr__(self) -> str:
+        pooled = sum(len(pool) for pool in self._pools.values())
+        return f'<{self.__class__.__name__} ({len(self._leases)} leased, {pooled} pooled)>'
+
+    def acquire(self, output: Output, shape: int | tuple[int, ...], dtype: DTypeLike = np.float32) -> NDArray[Any]:
+        # Nodes rendering twice in a block (or acquiring twice) shouldn't leak their previous lease
+        self.release(output)
+
+        key = ((shape,) if isinstance(shape, int) else tuple(shape), np.dtype(dtype))
+        try:
+            buffer = self._pools[key].pop()
+        except (KeyError, IndexError):
+            buffer = np.empty(shape=key[0], dtype=key[1])
+            self.allocation_count += 1
+
+        self._leases[output] = buffer
+        return buffer
+
+    def release(self, output: Output) -> None:
+        buffer = self._leases.pop(output, None)
+        if buffer is not None:
+            self._pools.setdefault((buffer.shape, buffer.dtype), []).append(buffer)
+
+    def release_all(self) -> None:
+        for output in list(self._leases):
+            self.release(output)
+
+    def clear(self) -> None:
+        self._pools.clear()
+        self._leases.clear()
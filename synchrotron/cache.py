@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+import os
+import sys
+from pathlib import Path
+
+
+def get_cache_directory() -> Path | None:
+    # Per-user cache for things which are slow to build on startup, or None if there's nowhere writable to put it
+    if override := os.environ.get('SYNCHROTRON_CACHE_DIR'):
+        directory = Path(override)
+    elif sys.platform == 'win32':
+        directory = Path(os.environ.get('LOCALAPPDATA') or Path.home() / 'AppData' / 'Local') / 'synchrotron'
+    elif sys.platform == 'darwin':
+        directory = Path.home() / 'Library' / 'Caches' / 'synchrotron'
+    else:
+        directory = Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache') / 'synchrotron'
+
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        return None
+    return directory
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .nodes import Node
+
+# Render times in seconds, from a cheap data node up to a whole block at low latency settings
+TIME_BUCKETS = (
+    1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 1e-1,
+)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = TIME_BUCKETS) -> None:
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)  # Last bucket is +Inf
+        self.count = 0
+        self.sum = 0.
+        self.max = 0.
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} count={self.count} sum={self.sum:.6f}>'
+
+    def observe(self, value: float) -> None:
+        self.bucket_counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def as_prometheus(self, name: str, labels: dict[str, str] | None = None) -> list[str]:
+        label_text = ''.join(f'{key}="{_escape_label(value)}",' for key, value in (labels or {}).items())
+        lines = []
+        cumulative_count = 0
+        for upper_bound, bucket_count in zip((*self.buckets, '+Inf'), self.bucket_counts, strict=True):
+            cumulative_count += bucket_count
+            lines.append(f'{name}_bucket{{{label_text}le="{upper_bound}"}} {cumulative_count}')
+        label_text = '{' + label_text.rstrip(',') + '}' if label_text else ''
+        lines.append(f'{name}_sum{label_text} {self.sum}')
+        lines.append(f'{name}_count{label_text} {self.count}')
+        return lines
+
+    def as_json(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.,
+            'max': self.max,
+            'buckets': dict(zip((*map(str, self.buckets), '+Inf'), self.bucket_counts, strict=True)),
+        }
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RenderMetrics:
+    # Render loop instrumentation. Per-node and per-block timing is only collected while enabled, but xrun counts are
+    # always kept as they cost nothing until something goes wrong.
+    def __init__(self, deadline: float, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.deadline = deadline
+        self.node_render_seconds: dict[Node, Histogram] = {}
+        self.block_render_seconds = Histogram()
+        self.blocks_rendered = 0
+        self.deadline_overruns = 0
+        self.underruns = 0
+        self.queue_depth = 0
+
+    def __repr__(self) -> str:
+        status = 'enabled' if self.enabled else 'disabled'
+        return (f'<{self.__class__.__name__} ({status}) blocks={self.blocks_rendered} '
+                f'overruns={self.deadline_overruns} underruns={self.underruns}>')
+
+    def reset(self) -> None:
+        self.node_render_seconds.clear()
+        self.block_render_seconds = Histogram()
+        self.blocks_rendered = 0
+        self.deadline_overruns = 0
+        self.underruns = 0
+        self.queue_depth = 0
+
+    def observe_node(self, node: Node, seconds: float) -> None:
+        histogram = self.node_render_seconds.get(node)
+        if histogram is None:
+            histogram = self.node_render_seconds[node] = Histogram()
+        histogram.observe(seconds)
+
+    def observe_block(self, seconds: float) -> None:
+        self.block_render_seconds.observe(seconds)
+        self.blocks_rendered += 1
+        if seconds > self.deadline:
+            self.deadline_overruns += 1
+
+    def forget_node(self, node: Node) -> None:
+        self.node_render_seconds.pop(node, None)
+
+    def as_prometheus(self) -> str:
+        lines = [
+            '# HELP synchrotron_block_render_seconds Time taken to render each block of the graph',
+            '# TYPE synchrotron_block_render_seconds histogram',
+            *self.block_render_seconds.as_prometheus('synchrotron_block_render_seconds'),
+            '# HELP synchrotron_node_render_seconds Time taken by each node to render a block',
+            '# TYPE synchrotron_node_render_seconds histogram',
+        ]
+        for node, histogram in list(self.node_render_seconds.items()):
+            labels = {'node': node.name, 'type': node.__class__.__name__}
+            lines.extend(histogram.as_prometheus('synchrotron_node_render_seconds', labels))
+        lines.extend([
+            '# HELP synchrotron_block_deadline_seconds Real time available to render each block',
+            '# TYPE synchrotron_block_deadline_seconds gauge',
+            f'synchrotron_block_deadline_seconds {self.deadline}',
+            '# HELP synchrotron_blocks_rendered_total Blocks rendered while metrics were enabled',
+            '# TYPE synchrotron_blocks_rendered_total counter',
+            f'synchrotron_blocks_rendered_total {self.blocks_rendered}',
+            '# HELP synchrotron_deadline_overruns_total Blocks which took longer than the deadline to render',
+            '# TYPE synchrotron_deadline_overruns_total counter',
+            f'synchrotron_deadline_overruns_total {self.deadline_overruns}',
+            '# HELP synchrotron_underruns_total Audio callbacks which found no rendered audio waiting',
+            '# TYPE synchrotron_underruns_total counter',
+            f'synchrotron_underruns_total {self.underruns}',
+            '# HELP synchrotron_output_queue_depth Rendered frames buffered ahead of the audio device',
+            '# TYPE synchrotron_output_queue_depth gauge',
+            f'synchrotron_output_queue_depth {self.queue_depth}',
+        ])
+        return '\n'.join(lines) + '\n'
+
+    def as_json(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'deadline': self.deadline,
+            'blocks_rendered': self.blocks_rendered,
+            'deadline_overruns': self.deadline_overruns,
+            'underruns': self.underruns,
+            'queue_depth': self.queue_depth,
+            'block_render_seconds': self.block_render_seconds.as_json(),
+            'node_render_seconds': {
+                node.name: {'type': node.__class__.__name__, **histogram.as_json()}
+                for node, histogram in list(self.node_render_seconds.items())
+            },
+        }
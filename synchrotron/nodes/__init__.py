@@ -1,5 +1,7 @@
 from ._base import (
     Connection,
+    ControlInput,
+    ControlOutput,
     DataInput,
     DataOutput,
     Input,
@@ -9,6 +11,8 @@ from ._base import (
     RenderContext,
     StreamInput,
     StreamOutput,
-    get_node_types,
 )
+from ._events import EventBuffer, EventInput, EventOutput
 from ._midi import MidiBuffer, MidiInput, MidiMessage, MidiOutput
+from ._phase import PhaseAccumulator
+from ._registry import NodeRegistry, get_node_types
@@ -2,21 +2,23 @@ from __future__ import annotations
 
 import abc
 from dataclasses import dataclass
-from importlib import import_module
-from pathlib import Path
-from typing import TYPE_CHECKING, Any, get_type_hints
+from typing import TYPE_CHECKING, Any, ClassVar, get_type_hints
 
 import numpy as np
 
 if TYPE_CHECKING:
     from collections.abc import ValuesView
 
-    from numpy.typing import NDArray
+    from numpy.typing import DTypeLike, NDArray
 
+    from synchrotron.buffer_arena import BufferArena
     from synchrotron.synchrotron import Synchrotron
 
 
 class Port:
+    # Ports and connections are slotted to keep the per-object cost of very large graphs down
+    __slots__ = ('node', 'name', 'buffer')
+
     def __init__(self, node: Node, name: str) -> None:
         self.node = node
         self.name = name
@@ -41,6 +43,8 @@ class Port:
 
 
 class Input(Port, abc.ABC):
+    __slots__ = ('connection',)
+
     def __init__(self, node: Node, name: str) -> None:
         super().__init__(node=node, name=name)
         self.connection: Connection | None = None
@@ -58,9 +62,21 @@ class Input(Port, abc.ABC):
 
 
 class Output(Port, abc.ABC):
+    __slots__ = ('_connections',)
+
     def __init__(self, node: Node, name: str) -> None:
         super().__init__(node=node, name=name)
-        self.connections: list[Connection] = []
+        self._connections: dict[Input, Connection] = {}
+
+    @property
+    def connections(self) -> tuple[Connection, ...]:
+        return tuple(self._connections.values())
+
+    def attach(self, connection: Connection) -> None:
+        self._connections[connection.sink] = connection
+
+    def detach(self, connection: Connection) -> None:
+        del self._connections[connection.sink]
 
     @abc.abstractmethod
     def write(self, buffer: Any) -> None:
@@ -75,6 +91,8 @@ class Output(Port, abc.ABC):
 
 
 class DataInput(Input):
+    __slots__ = ()
+
     def read(self, default: Any = None) -> Any:
         if self.buffer is None:
             return default
@@ -82,27 +100,172 @@ class DataInput(Input):
 
 
 class DataOutput(Output):
+    __slots__ = ()
+
     def write(self, buffer: Any) -> None:
         self.buffer = buffer
 
 
-class StreamInput(Input):
-    # TODO: Some magic with generics to allow for non-float32 streams
-    def read(self, render_context: RenderContext, default_constant: float = 0.) -> NDArray[np.float32]:
+# Abstract scalar types, which accept any dtype under them as is, and the dtype used where one has to be picked
+_DEFAULT_DTYPES: dict[type[np.generic], np.dtype] = {
+    np.number: np.dtype(np.float32),
+    np.inexact: np.dtype(np.float32),
+    np.floating: np.dtype(np.float32),
+    np.integer: np.dtype(np.int64),
+    np.signedinteger: np.dtype(np.int64),
+}
+_typed_stream_ports: dict[tuple[type[Port], type[np.generic]], type[Port]] = {}
+
+
+class _TypedStreamPort:
+    # Mixin letting stream ports be parametrised by the scalar type of their samples, e.g. StreamInput[np.bool_]
+    __slots__ = ()
+    scalar_type: ClassVar[type[np.generic]] = np.float32
+    # Concrete dtype of buffers created for the port
+    dtype: ClassVar[np.dtype] = np.dtype(np.float32)
+
+    def __class_getitem__(cls, scalar_type: type[np.generic]) -> type:
+        typed_port = _typed_stream_ports.get((cls, scalar_type))
+        if typed_port is None:
+            typed_port = _typed_stream_ports[cls, scalar_type] = type(cls.__name__, (cls,), {
+                '__slots__': (),
+                '__module__': cls.__module__,
+                '__qualname__': f'{cls.__qualname__}[{scalar_type.__name__}]',
+                'scalar_type': scalar_type,
+                'dtype': _DEFAULT_DTYPES[scalar_type] if scalar_type in _DEFAULT_DTYPES else np.dtype(scalar_type),
+            })
+        return typed_port
+
+    def as_json(self, *args, **kwargs) -> dict:
+        json = super().as_json(*args, **kwargs)
+        json['dtype'] = self.scalar_type.__name__
+        return json
+
+
+class StreamInput(_TypedStreamPort, Input):
+    __slots__ = ('_constant_buffer', '_constant_value', '_control_value', '_ramp')
+
+    def __init__(self, node: Node, name: str) -> None:
+        super().__init__(node=node, name=name)
+        self._constant_buffer: NDArray | None = None
+        self._constant_value: Any = None
+        self._control_value: Any = None
+        self._ramp: NDArray[np.float32] | None = None
+
+    def conversion_dtype(self, source: Output) -> np.dtype | None:
+        # The dtype which a source's buffers have to be converted to for this input, or None if they can be read as
+        # they are. Sources which can't be converted without losing their meaning (e.g. float to bool) are refused.
+        if not isinstance(source, StreamOutput) or np.issubdtype(source.dtype, self.scalar_type):
+            return None
+        if not np.can_cast(source.dtype, self.dtype, casting='same_kind'):
+            raise ValueError(f'cannot connect {source.instance_name} ({source.dtype} stream) '
+                             f'to {self.instance_name} ({self.scalar_type.__name__} stream)')
+        return self.dtype
+
+    # Returned buffers are shared with other nodes (or reused across blocks), so they must be treated as read-only.
+    # Streams are 1D when mono and (channels, frames) otherwise. Given a channel count, the stream is returned as
+    # (channels, frames), with mono and single channel streams broadcast across every channel.
+    def read(
+        self,
+        render_context: RenderContext,
+        default_constant: float = 0.,
+        interpolate: bool = True,
+        channels: int | None = None,
+    ) -> NDArray:
+        buffer = self._read(render_context, default_constant, interpolate)
+        if channels is None:
+            return buffer
+        return self._broadcast_channels(buffer, channels)
+
+    def _read(self, render_context: RenderContext, default_constant: float, interpolate: bool) -> NDArray:
         if self.connection is None:
-            self.buffer = np.full(shape=render_context.buffer_size, fill_value=default_constant, dtype=np.float32)
-        elif not isinstance(self.buffer, np.ndarray):
-            self.buffer = np.full(shape=render_context.buffer_size, fill_value=self.buffer, dtype=np.float32)
+            return self._broadcast_constant(render_context, default_constant)
+        if isinstance(self.buffer, np.ndarray):
+            return self.buffer
+
+        if interpolate and isinstance(self.connection.source, ControlOutput) and self.dtype.kind == 'f':
+            return self._interpolate_control(render_context, self.buffer)
+        return self._broadcast_constant(render_context, self.buffer)
+
+    def _broadcast_channels(self, buffer: NDArray, channels: int) -> NDArray:
+        if buffer.ndim == 2 and buffer.shape[0] == channels:
+            return buffer
+        if buffer.ndim == 1 or (buffer.ndim == 2 and buffer.shape[0] == 1):
+            return np.broadcast_to(buffer, shape=(channels, buffer.shape[-1]))
+        raise ValueError(f'cannot read stream of shape {buffer.shape} into {self.instance_name} as {channels} channels')
+
+    def _broadcast_constant(self, render_context: RenderContext, value: Any) -> NDArray:
+        buffer = self._constant_buffer
+        if buffer is None or buffer.shape[0] != render_context.buffer_size:
+            buffer = self._constant_buffer = np.empty(shape=render_context.buffer_size, dtype=self.dtype)
+        elif value == self._constant_value:
+            return buffer
+
+        buffer.fill(value)
+        self._constant_value = value
+        return buffer
+
+    def _interpolate_control(self, render_context: RenderContext, value: float) -> NDArray[np.float32]:
+        # Linear ramp from the previous block's control value, reaching the new value on the last sample
+        previous_value = self._control_value
+        self._control_value = value
+        if previous_value is None or previous_value == value:
+            return self._broadcast_constant(render_context, value)
+
+        if self._ramp is None or self._ramp.size != render_context.buffer_size:
+            self._ramp = np.arange(1, render_context.buffer_size + 1, dtype=np.float32) / render_context.buffer_size
+        buffer = self._broadcast_constant(render_context, previous_value)
+        np.multiply(self._ramp, value - previous_value, out=buffer)
+        buffer += previous_value
+        self._constant_value = None
+        return buffer
+
+
+class StreamOutput(_TypedStreamPort, Output):
+    __slots__ = ()
+
+    def acquire(
+        self,
+        render_context: RenderContext,
+        shape: int | tuple[int, ...] | None = None,
+        dtype: DTypeLike | None = None,
+    ) -> NDArray:
+        # Uninitialised buffer for this block, for the node to render into in place and then write()
+        if shape is None:
+            shape = render_context.buffer_size
+        if dtype is None:
+            dtype = self.dtype
+        if render_context.arena is None:
+            return np.empty(shape=shape, dtype=dtype)
+        return render_context.arena.acquire(self, shape=shape, dtype=dtype)
+
+    def write(self, buffer: NDArray) -> None:
+        self.buffer = buffer
 
+
+class ControlInput(Input):
+    # Control-rate input carrying a single value per block, for slowly changing parameters
+    __slots__ = ()
+
+    def read(self, render_context: RenderContext, default_constant: float = 0.) -> float:
+        if self.connection is None or self.buffer is None:
+            return default_constant
+        if isinstance(self.buffer, np.ndarray):
+            # Audio-rate sources are sampled once, at the start of the block
+            return float(self.buffer.flat[0])
         return self.buffer
 
 
-class StreamOutput(Output):
-    def write(self, buffer: NDArray[np.float32]) -> None:
+class ControlOutput(Output):
+    __slots__ = ()
+
+    def write(self, buffer: float) -> None:
         self.buffer = buffer
 
 
 class Connection:
+    __slots__ = ('source', 'sink', 'is_connected')
+
     def __init__(self, source: Output, sink: Input, is_connected: bool = False) -> None:
         self.source = source
         self.sink = sink
@@ -129,6 +292,13 @@ class Connection:
 
 
 class Node(abc.ABC):
+    # Pure nodes have no state, side effects or dependence on time, so their output only depends on their inputs.
+    # Pure nodes with constant inputs are rendered once and their output reused until the graph changes.
+    pure: ClassVar[bool] = False
+    # Sinks have side effects outside the graph (playback, files, draining MIDI queues...) so always get rendered,
+    # along with everything upstream of them. Nodes which can't reach a sink aren't rendered at all.
+    is_sink: ClassVar[bool] = False
+
     def __init__(self, synchrotron: Synchrotron, name: str) -> None:
         self.synchrotron = synchrotron
         self.name = name
@@ -138,7 +308,7 @@ class Node(abc.ABC):
 
         # A bit of magic so inputs and outputs are nicer to interact with
         for name, cls in get_type_hints(self.__class__).items():
-            if not issubclass(cls, Port):
+            if not isinstance(cls, type) or not issubclass(cls, Port):
                 continue
 
             if name in self._inputs or name in self._outputs:
@@ -208,19 +378,11 @@ class Node(abc.ABC):
         pass
 
 
-@dataclass
+@dataclass(slots=True)
 class RenderContext:
     global_clock: int
     sample_rate: int
     buffer_size: int
-
-
-def get_node_types() -> list[type[Node]]:
-    node_types = []
-
-    for path in Path(__file__).parent.rglob('[!_]*.py'):
-        module = import_module('.' + path.stem, package='synchrotron.nodes')
-        if hasattr(module, '__all__'):
-            node_types.extend(getattr(module, node_name) for node_name in module.__all__)
-
-    return node_types
+    arena: BufferArena | None = None
+    # perf_counter() time which the block's first sample corresponds to, for placing timestamped input within it
+    block_time: float = 0.
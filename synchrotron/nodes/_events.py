@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from synchrotron.nodes import Input, Node, Output
+
+if TYPE_CHECKING:
+    from numpy.typing import NDArray
+
+# One row per event, with its sample offset into the block, the channel it's on (or 0 for mono event streams), and a
+# value (1 for plain triggers)
+EVENT_DTYPE = np.dtype([('offset', np.int32), ('channel', np.int16), ('value', np.float32)])
+_NO_EVENTS = np.empty(shape=0, dtype=EVENT_DTYPE)
+_NO_EVENTS.flags.writeable = False
+
+
+class EventBuffer:
+    # Sparse stream of a block's events (e.g. triggers) as a structured array sorted by offset, so nodes handling them
+    # do work per event rather than per sample. Several events can share an offset. Events are either mono, or on one
+    # of a number of channels (e.g. voices), matching a (channels, frames) stream.
+    __slots__ = ('events', 'length', 'channels')
+
+    def __init__(self, length: int, events: NDArray | None = None, channels: int | None = None):
+        self.length = length
+        self.events: NDArray = _NO_EVENTS if events is None else events
+        self.channels = channels
+
+    @classmethod
+    def from_offsets(
+        cls,
+        length: int,
+        offsets: NDArray,
+        values: NDArray | float = 1.,
+        channel_indices: NDArray | None = None,
+        channels: int | None = None,
+    ) -> EventBuffer:
+        # Offsets must already be sorted
+        if not len(offsets):
+            return cls(length, channels=channels)
+        if offsets[0] < 0 or offsets[-1] >= length:
+            raise ValueError(f'event offset out of bounds for buffer length {length}')
+
+        events = np.empty(shape=len(offsets), dtype=EVENT_DTYPE)
+        events['offset'] = offsets
+        events['channel'] = 0 if channel_indices is None else channel_indices
+        events['value'] = values
+        return cls(length, events, channels)
+
+    @classmethod
+    def from_dense(cls, buffer: NDArray) -> EventBuffer:
+        # An event for every non-zero sample of a mono or (channels, frames) stream, with the sample as its value
+        if buffer.ndim == 1:
+            offsets = np.flatnonzero(buffer)
+            return cls.from_offsets(len(buffer), offsets, buffer[offsets])
+        if buffer.ndim != 2:
+            raise ValueError(f'cannot convert stream of shape {buffer.shape} to events')
+
+        # Transposed so the non-zero samples come out in order of offset, then channel
+        offsets, channel_indices = np.nonzero(buffer.T)
+        return cls.from_offsets(
+            buffer.shape[1], offsets, buffer[channel_indices, offsets], channel_indices, channels=buffer.shape[0],
+        )
+
+    def to_dense(self, out: NDArray) -> NDArray:
+        # Zero everywhere but the events' offsets; where events share an offset, the last one's value wins
+        out.fill(0)
+        if self.channels is None:
+            out[self.events['offset']] = self.events['value']
+        else:
+            out[self.events['channel'], self.events['offset']] = self.events['value']
+        return out
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        # Shape of the equivalent dense stream
+        return (self.length,) if self.channels is None else (self.channels, self.length)
+
+    @property
+    def offsets(self) -> NDArray[np.int32]:
+        return self.events['offset']
+
+    @property
+    def channel_indices(self) -> NDArray[np.int16]:
+        return self.events['channel']
+
+    @property
+    def values(self) -> NDArray[np.float32]:
+        return self.events['value']
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def __repr__(self) -> str:
+        return f'EventBuffer({self.events.tolist()})'
+
+
+class EventInput(Input):
+    __slots__ = ()
+
+    def __init__(self, node: Node, name: str) -> None:
+        super().__init__(node, name)
+        self.buffer: EventBuffer = EventBuffer(length=node.synchrotron.buffer_size)
+
+    def read(self) -> EventBuffer:
+        # Unlike a stream's last buffer, the last events mustn't be repeated once the input is disconnected
+        if self.connection is None:
+            return EventBuffer(length=self.buffer.length)
+        return self.buffer
+
+
+class EventOutput(Output):
+    __slots__ = ()
+
+    def __init__(self, node: Node, name: str):
+        super().__init__(node, name)
+        self.buffer: EventBuffer = EventBuffer(length=node.synchrotron.buffer_size)
+
+    def write(self, buffer: EventBuffer) -> None:
+        self.buffer = buffer
@@ -1,7 +1,16 @@
 from __future__ import annotations
 
+from typing import TYPE_CHECKING
+
+import numpy as np
+
 from synchrotron.nodes import Input, Node, Output
 
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from numpy.typing import NDArray
+
 
 class MidiMessage:
     OPCODE_MASK = 0xf0
@@ -9,37 +18,79 @@ class MidiMessage:
 
     NOTE_OFF = 0x80
     NOTE_ON = 0x90
+    PROGRAM_CHANGE = 0xc0
+    CHANNEL_PRESSURE = 0xd0
+    SYSTEM = 0xf0
+
+    @classmethod
+    def length(cls, status: int) -> int:
+        # Bytes in a message with the given status byte, as far as a MidiBuffer stores it
+        opcode = status & cls.OPCODE_MASK
+        if opcode in (cls.PROGRAM_CHANGE, cls.CHANNEL_PRESSURE):
+            return 2
+        if opcode == cls.SYSTEM:
+            return {0xf1: 2, 0xf2: 3, 0xf3: 2}.get(status, 1)
+        return 3
+
+
+# One row per MIDI message, with its sample offset into the block
+MIDI_EVENT_DTYPE = np.dtype([('offset', np.int32), ('status', np.uint8), ('data1', np.uint8), ('data2', np.uint8)])
+_NO_EVENTS = np.empty(shape=0, dtype=MIDI_EVENT_DTYPE)
+_NO_EVENTS.flags.writeable = False
 
 
 class MidiBuffer:
-    def __init__(self, length: int):
-        self.data: dict[int, list[bytes]] = {}
+    # A block's MIDI messages as a structured array, sorted by offset (messages at the same offset keep the order they
+    # were added in). Only the status and first two data bytes of a message are kept, so SysEx payloads are dropped.
+    __slots__ = ('events', 'length')
+
+    def __init__(self, length: int, events: NDArray | None = None):
         self.length = length
+        self.events: NDArray = _NO_EVENTS if events is None else events
+
+    @classmethod
+    def from_messages(cls, length: int, messages: Iterable[tuple[int, bytes]]) -> MidiBuffer:
+        rows = [(position, *message[:3].ljust(3, b'\0')) for position, message in messages]
+        if not rows:
+            return cls(length)
+
+        events = np.array(rows, dtype=MIDI_EVENT_DTYPE)
+        if events['offset'].min() < 0 or events['offset'].max() >= length:
+            raise ValueError(f'MIDI message position out of bounds for buffer length {length}')
+        return cls(length, events[np.argsort(events['offset'], kind='stable')])
 
     def __len__(self) -> int:
-        return sum(len(msgs) for msgs in self.data.values())
+        return len(self.events)
 
-    def get_messages_at_pos(self, position: int) -> tuple[bytes, ...]:
-        if position not in range(self.length):
+    def _check_position(self, position: int) -> None:
+        if not 0 <= position < self.length:
             raise ValueError(f'MIDI message position {position} out of bounds for buffer length {self.length}')
 
-        if position not in self.data:
+    def get_messages_at_pos(self, position: int) -> tuple[bytes, ...]:
+        self._check_position(position)
+        if not len(self.events):
             return ()
-        return tuple(self.data[position])
 
-    def add_message(self, position: int, message: bytes):
-        if position not in range(self.length):
-            raise ValueError(f'MIDI message position {position} out of bounds for buffer length {self.length}')
+        offsets = self.events['offset']
+        start, stop = np.searchsorted(offsets, (position, position + 1))
+        return tuple(
+            bytes((status, data1, data2)[:MidiMessage.length(status)])
+            for _, status, data1, data2 in self.events[start:stop].tolist()
+        )
 
-        if position not in self.data:
-            self.data[position] = []
-        self.data[position].append(message)
+    def add_message(self, position: int, message: bytes):
+        self._check_position(position)
+        index = np.searchsorted(self.events['offset'], position, side='right')
+        event = np.array((position, *message[:3].ljust(3, b'\0')), dtype=MIDI_EVENT_DTYPE)
+        self.events = np.insert(self.events, index, event)
 
     def __repr__(self) -> str:
-        return f'MidiBuffer({self.data})'
+        return f'MidiBuffer({self.events.tolist()})'
 
 
 class MidiInput(Input):
+    __slots__ = ()
+
     def __init__(self, node: Node, name: str) -> None:
         super().__init__(node, name)
         self.buffer: MidiBuffer = MidiBuffer(length=node.synchrotron.buffer_size)
@@ -49,6 +100,8 @@ class MidiInput(Input):
 
 
 class MidiOutput(Output):
+    __slots__ = ()
+
     def __init__(self, node: Node, name: str):
         super().__init__(node, name)
         self.buffer: MidiBuffer = MidiBuffer(length=node.synchrotron.buffer_size)
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from numpy.typing import NDArray
+
+
+class PhaseAccumulator:
+    # Oscillator phase in cycles, in the range [0, 1). Phase is carried between blocks in float64 and wrapped
+    # every block, so it never loses precision no matter how long the engine has been running.
+    def __init__(self) -> None:
+        self.phase: float | NDArray[np.float64] = 0.
+        self._phases: NDArray[np.float64] | None = None
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}(phase={self.phase!r})'
+
+    def reset(self, phase: float = 0.) -> None:
+        self.phase = phase
+
+    def advance(self, frequency: NDArray, sample_rate: int) -> NDArray[np.float64]:
+        # Returns the phase at every sample of the block, then moves the phase on to the start of the next block.
+        # The returned array is scratch space owned by the accumulator, only valid until the next call.
+        phases = self._phases
+        if phases is None or phases.shape != frequency.shape:
+            phases = self._phases = np.empty(shape=frequency.shape, dtype=np.float64)
+            if np.shape(self.phase) != frequency.shape[:-1]:
+                # Number of parallel phases (e.g. polyphonic voices) changed, so per-channel phase is meaningless
+                self.phase = np.zeros(shape=frequency.shape[:-1], dtype=np.float64) if frequency.ndim > 1 else 0.
+
+        # Exclusive cumulative sum of the per-sample phase increments, starting from the carried phase
+        phases[..., 0] = self.phase
+        np.divide(frequency[..., :-1], sample_rate, out=phases[..., 1:], dtype=np.float64)
+        np.cumsum(phases, axis=-1, out=phases)
+
+        next_phase = phases[..., -1] + np.divide(frequency[..., -1], sample_rate, dtype=np.float64)
+        self.phase = np.mod(next_phase, 1.) if frequency.ndim > 1 else float(next_phase % 1.)
+        np.mod(phases, 1., out=phases)
+        return phases
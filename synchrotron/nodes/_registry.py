@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import ast
+import json
+from collections.abc import Iterator, MutableMapping
+from importlib import import_module
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from synchrotron.cache import get_cache_directory
+
+if TYPE_CHECKING:
+    from . import Node
+
+INDEX_FILE_NAME = 'node_index.json'
+
+
+def _scan_module(path: Path) -> list[str]:
+    # Reads a module's __all__ without importing it, so its (possibly heavy) dependencies stay unloaded
+    for statement in ast.parse(path.read_bytes(), filename=str(path)).body:
+        if isinstance(statement, ast.Assign) and any(
+            isinstance(target, ast.Name) and target.id == '__all__' for target in statement.targets
+        ):
+            return list(ast.literal_eval(statement.value))
+    return []
+
+
+def build_node_index() -> dict[str, str]:
+    # Maps node type names to the names of the modules defining them. Scans are cached per module by modification
+    # time and size, so startup only has to stat the package unless something has changed.
+    cache_directory = get_cache_directory()
+    index_path = None if cache_directory is None else cache_directory / INDEX_FILE_NAME
+    try:
+        cached_modules = json.loads(index_path.read_text())['modules']  # type: ignore[union-attr]
+    except (AttributeError, OSError, ValueError, KeyError, TypeError):
+        cached_modules = {}
+
+    modules = {}
+    for path in sorted(Path(__file__).parent.glob('[!_]*.py')):
+        stat = path.stat()
+        entry = cached_modules.get(path.stem)
+        if entry is None or entry.get('mtime_ns') != stat.st_mtime_ns or entry.get('size') != stat.st_size:
+            entry = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'node_types': _scan_module(path)}
+        modules[path.stem] = entry
+
+    if modules != cached_modules and index_path is not None:
+        try:
+            index_path.write_text(json.dumps({'modules': modules}))
+        except OSError:
+            pass  # A read-only cache only costs a rescan next time
+
+    return {node_type: module for module, entry in modules.items() for node_type in entry['node_types']}
+
+
+class NodeRegistry(MutableMapping[str, 'type[Node]']):
+    # Node types by name, importing each node module the first time one of its types is looked up. Types can also be
+    # registered (or overridden) directly, e.g. to swap out hardware nodes when rendering offline.
+    def __init__(self) -> None:
+        self._modules = build_node_index()
+        self._node_types: dict[str, type[Node]] = {}
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} ({len(self._node_types)}/{len(self)} loaded)>'
+
+    def __getitem__(self, name: str) -> type[Node]:
+        try:
+            return self._node_types[name]
+        except KeyError:
+            module_name = self._modules[name]
+
+        module = import_module('.' + module_name, package=__package__)
+        node_type = self._node_types[name] = getattr(module, name)
+        return node_type
+
+    def __setitem__(self, name: str, node_type: type[Node]) -> None:
+        self._node_types[name] = node_type
+
+    def __delitem__(self, name: str) -> None:
+        if name not in self._modules and name not in self._node_types:
+            raise KeyError(name)
+        self._modules.pop(name, None)
+        self._node_types.pop(name, None)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(dict.fromkeys((*self._modules, *self._node_types)))
+
+    def __len__(self) -> int:
+        return len(self._modules.keys() | self._node_types.keys())
+
+    def __contains__(self, name: object) -> bool:
+        # Checked without importing, so an unavailable optional dependency only surfaces when the type is used
+        return name in self._modules or name in self._node_types
+
+
+def get_node_types() -> list[type[Node]]:
+    return list(NodeRegistry().values())
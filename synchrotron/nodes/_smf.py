@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+from fractions import Fraction
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from ._midi import MidiMessage
+
+if TYPE_CHECKING:
+    from numpy.typing import NDArray
+
+SMF_EVENT_DTYPE = np.dtype([('tick', np.int64), ('status', np.uint8), ('data1', np.uint8), ('data2', np.uint8)])
+DEFAULT_TEMPO = 500_000  # Microseconds per quarter note, i.e. 120bpm
+
+
+def _read_variable_length(data: bytes, position: int) -> tuple[int, int]:
+    value = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value = (value << 7) | (byte & 0x7f)
+        if not byte & 0x80:
+            return value, position
+
+
+class MidiFile:
+    # Standard MIDI File (format 0 or 1), parsed once into channel events from every track merged in time order, plus
+    # the tempo map needed to turn ticks into seconds. SysEx and meta events other than tempo are skipped.
+    def __init__(self, data: bytes) -> None:
+        if data[:4] != b'MThd':
+            raise ValueError('not a standard MIDI file')
+        header_length = int.from_bytes(data[4:8], 'big')
+        self.format = int.from_bytes(data[8:10], 'big')
+        track_count = int.from_bytes(data[10:12], 'big')
+        self.division = int.from_bytes(data[12:14], 'big')
+        if self.format == 2:
+            raise ValueError('format 2 (sequential tracks) MIDI files are not supported')
+
+        events: list[tuple[int, int, int, int]] = []
+        tempo_changes: list[tuple[int, int]] = []
+        self.end_tick = 0
+        position = 8 + header_length
+        for _ in range(track_count):
+            if data[position:position + 4] != b'MTrk':
+                raise ValueError(f'expected a track chunk at byte {position}')
+            track_length = int.from_bytes(data[position + 4:position + 8], 'big')
+            position += 8
+            self.end_tick = max(self.end_tick, self._parse_track(
+                data[position:position + track_length], events, tempo_changes,
+            ))
+            position += track_length
+        self.track_count = track_count
+
+        # Sorting by tick alone is stable, so simultaneous events keep their order within and between tracks
+        self.events = np.array(events, dtype=SMF_EVENT_DTYPE)
+        self.events = self.events[np.argsort(self.events['tick'], kind='stable')]
+        tempo_changes.sort(key=lambda change: change[0])
+        self.tempo_ticks = np.array([0, *(tick for tick, _ in tempo_changes)], dtype=np.int64)
+        self.tempos = np.array([DEFAULT_TEMPO, *(tempo for _, tempo in tempo_changes)], dtype=np.int64)
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} (format {self.format}, {self.track_count} tracks, {len(self.events)} events)>'
+
+    @staticmethod
+    def _parse_track(
+        track: bytes, events: list[tuple[int, int, int, int]], tempo_changes: list[tuple[int, int]],
+    ) -> int:
+        tick = 0
+        position = 0
+        running_status = 0
+        while position < len(track):
+            delta, position = _read_variable_length(track, position)
+            tick += delta
+
+            status = track[position]
+            if status == 0xff:
+                meta_type = track[position + 1]
+                length, position = _read_variable_length(track, position + 2)
+                if meta_type == 0x51:
+                    tempo_changes.append((tick, int.from_bytes(track[position:position + 3], 'big')))
+                position += length
+                if meta_type == 0x2f:
+                    break
+                continue
+            if status in (0xf0, 0xf7):
+                length, position = _read_variable_length(track, position + 1)
+                position += length
+                continue
+
+            if status & 0x80:
+                running_status = status
+                position += 1
+            elif not running_status:
+                raise ValueError(f'data byte without a status at track byte {position}')
+            data_length = MidiMessage.length(running_status) - 1
+            data1 = track[position]
+            data2 = track[position + 1] if data_length == 2 else 0
+            position += data_length
+            events.append((tick, running_status, data1, data2))
+        return tick
+
+    def to_samples(self, ticks: NDArray[np.int64], sample_rate: int) -> NDArray[np.int64]:
+        # Exact rational arithmetic, as tick times often land exactly halfway between samples and float error would
+        # round those either way. Halves are rounded up.
+        if self.division & 0x8000:
+            # SMPTE timing: negative frames per second in the top byte, ticks per frame in the bottom one
+            frames_per_second = 256 - (self.division >> 8)
+            slopes = [Fraction(sample_rate, frames_per_second * (self.division & 0xff))]
+            segment_ticks = [0]
+        else:
+            # Samples are piecewise linear in ticks, changing slope at each tempo change
+            slopes = [Fraction(tempo * sample_rate, 1_000_000 * self.division) for tempo in self.tempos.tolist()]
+            segment_ticks = self.tempo_ticks.tolist()
+
+        samples = np.empty_like(ticks)
+        segments = np.searchsorted(segment_ticks, ticks, side='right') - 1
+        segment_start = Fraction(0)
+        for segment, (tick, slope) in enumerate(zip(segment_ticks, slopes, strict=True)):
+            if segment:
+                segment_start += (tick - segment_ticks[segment - 1]) * slopes[segment - 1]
+            in_segment = segments == segment
+            # Twice the exact position plus one, floor divided by two, is the position rounded half up. The numbers
+            # involved easily overflow int64, so this is done with Python ints in an object array.
+            base = segment_start * 2 + 1
+            numerators = (ticks[in_segment] - tick).astype(object) * (slope.numerator * base.denominator * 2)
+            numerators += base.numerator * slope.denominator
+            samples[in_segment] = (numerators // (slope.denominator * base.denominator * 2)).astype(np.int64)
+        return samples
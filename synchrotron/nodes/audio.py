@@ -1,141 +1,401 @@
 from __future__ import annotations
 
 from pathlib import Path
-from queue import Queue
+from queue import Empty, Queue
+from threading import Thread
 from typing import TYPE_CHECKING
 
 import numpy as np
-import pyaudio
-from soundfile import SoundFile
 
-from . import DataInput, Node, RenderContext, StreamInput, StreamOutput
+from synchrotron.ring_buffer import RingBuffer
+
+from . import DataInput, EventInput, Node, PhaseAccumulator, RenderContext, StreamInput, StreamOutput
 
 if TYPE_CHECKING:
+    from numpy.typing import NDArray
+    from soundfile import SoundFile
+
     from synchrotron.synchrotron import Synchrotron
 
-__all__ = ['SilenceNode', 'SineNode', 'SquareNode', 'SawtoothNode', 'PlaybackNode', 'WavFileNode']
+__all__ = [
+    'SilenceNode',
+    'SineNode',
+    'SquareNode',
+    'SawtoothNode',
+    'PlaybackNode',
+    'WavFileNode',
+    'FilePlayerNode',
+    'SampleNode',
+]
 
 
 class SilenceNode(Node):
     out: StreamOutput
+    pure = True
 
     def render(self, ctx: RenderContext) -> None:
-        self.out.write(np.zeros(shape=ctx.buffer_size, dtype=np.float32))
+        buffer = self.out.acquire(ctx)
+        buffer.fill(0)
+        self.out.write(buffer)
 
 
 class SineNode(Node):
-    frequency: StreamInput
+    # Phase is accumulated in float64, so higher precision frequency streams are taken as they are
+    frequency: StreamInput[np.floating]
     out: StreamOutput
 
     def __init__(self, synchrotron: Synchrotron, name: str) -> None:
         super().__init__(synchrotron, name)
-        self.phase = 0.
+        self.phase = PhaseAccumulator()
 
     def render(self, ctx: RenderContext) -> None:
-        frequency = self.frequency.read(ctx)
-        waveform = np.empty(shape=ctx.buffer_size, dtype=np.float32)
-
-        for i in range(ctx.buffer_size):
-            waveform[i] = self.phase
-            self.phase += 2 * np.pi * frequency[i] / ctx.sample_rate
-            self.phase %= 2 * np.pi
-
-        self.out.write(np.sin(waveform))
+        phases = self.phase.advance(self.frequency.read(ctx), ctx.sample_rate)
+        phases *= 2 * np.pi
+        self.out.write(np.sin(phases, out=self.out.acquire(ctx, shape=phases.shape)))
 
 
 class SquareNode(Node):
-    frequency: StreamInput
-    pwm: StreamInput
+    frequency: StreamInput[np.floating]
+    pwm: StreamInput[np.floating]
     out: StreamOutput
 
     def __init__(self, synchrotron: Synchrotron, name: str) -> None:
         super().__init__(synchrotron, name)
-        self.phase = 0.
+        self.phase = PhaseAccumulator()
 
     def render(self, ctx: RenderContext) -> None:
-        frequency = self.frequency.read(ctx)
-        waveform = np.empty(shape=ctx.buffer_size, dtype=np.float32)
+        phases = self.phase.advance(self.frequency.read(ctx), ctx.sample_rate)
         pwm_threshold = self.pwm.read(ctx, default_constant=0.5)
 
-        for i in range(ctx.buffer_size):
-            waveform[i] = 1 if self.phase > pwm_threshold[i] else -1
-            self.phase += frequency[i] / ctx.sample_rate
-            self.phase %= 1
-
+        # 1 where the phase is past the PWM threshold, otherwise -1
+        waveform = np.greater(phases, pwm_threshold, out=self.out.acquire(ctx, shape=phases.shape))
+        waveform *= 2
+        waveform -= 1
         self.out.write(waveform)
 
 
 class SawtoothNode(Node):
-    frequency: StreamInput
+    frequency: StreamInput[np.floating]
     out: StreamOutput
 
     def __init__(self, synchrotron: Synchrotron, name: str) -> None:
         super().__init__(synchrotron, name)
-        self.phase = 0.
+        self.phase = PhaseAccumulator()
 
     def render(self, ctx: RenderContext) -> None:
-        frequency = self.frequency.read(ctx)
-        waveform = np.empty(shape=ctx.buffer_size, dtype=np.float32)
-
-        for i in range(ctx.buffer_size):
-            waveform[i] = self.phase
-            self.phase += frequency[i] / ctx.sample_rate
-            self.phase %= 1
-
+        phases = self.phase.advance(self.frequency.read(ctx), ctx.sample_rate)
+        waveform = self.out.acquire(ctx, shape=phases.shape)
+        np.copyto(waveform, phases, casting='same_kind')
         self.out.write(waveform)
 
 
 class PlaybackNode(Node):
+    # Plays a stereo signal, or separate left and right signals if it isn't connected
+    signal: StreamInput
     left: StreamInput
     right: StreamInput
+    is_sink = True
 
     def __init__(self, synchrotron: Synchrotron, name: str) -> None:
         super().__init__(synchrotron, name)
 
-        self.playback_queue = Queue()
-        synchrotron.add_output_queue(self.playback_queue)
+        self.stereo_buffer = np.empty(shape=(synchrotron.buffer_size, 2), dtype=np.float32)
+        self.ring_buffer = RingBuffer(capacity=synchrotron.render_ahead * synchrotron.buffer_size, channels=2)
+        synchrotron.add_output_buffer(self.ring_buffer)
+        # Read before opening the stream, as its callbacks can start straight away
+        self.device_realtime = synchrotron.audio_backend.realtime
 
-        # noinspection PyTypeChecker
-        self.stream = synchrotron.pyaudio_session.open(
-            rate=synchrotron.sample_rate,
+        self.stream = synchrotron.audio_backend.open_output(
+            sample_rate=synchrotron.sample_rate,
             channels=2,
-            format=pyaudio.paFloat32,
-            output=True,
-            frames_per_buffer=synchrotron.buffer_size,
-            stream_callback=self._pyaudio_callback,
+            buffer_size=synchrotron.buffer_size,
+            callback=self._output_callback,
         )
 
-        self.exports['Device'] = synchrotron.pyaudio_session.get_default_output_device_info().get('name')
+        self.exports['Device'] = synchrotron.audio_backend.device_name
+        self.exports['Latency'] = f'{synchrotron.render_ahead * synchrotron.buffer_size / synchrotron.sample_rate:.4f}s'
 
-    def _pyaudio_callback(self, *_):
-        buffer = self.playback_queue.get()
-        self.playback_queue.task_done()
-        return buffer, pyaudio.paContinue
+    def _output_callback(self, out: NDArray[np.float32]) -> None:
+        # A real device never waits: if the render thread hasn't kept up, it gets silence (and most likely glitches).
+        # Devices without a clock of their own wait for the block instead, until the node is torn down.
+        if not self.device_realtime:
+            self.ring_buffer.wait_readable(len(out))
+        frames_read = self.ring_buffer.read_into(out)
+        if frames_read < len(out):
+            out[frames_read:] = 0
+            if self.synchrotron.rendering:
+                self.synchrotron.metrics.underruns += 1
 
     def render(self, ctx: RenderContext) -> None:
-        left_buffer = self.left.read(ctx)
-        right_buffer = self.right.read(ctx)
+        if self.signal.connection is not None:
+            # The transpose of a (channels, frames) stream is a strided view rather than interleaved samples, so the
+            # ring buffer's write does the interleaving as it copies the block in, with no intermediate buffer
+            self.ring_buffer.write(self.signal.read(ctx, channels=2).T)
+            return
 
-        stereo_buffer = np.empty(shape=left_buffer.size + right_buffer.size, dtype=np.float32)
-        stereo_buffer[0::2] = left_buffer
-        stereo_buffer[1::2] = right_buffer
-        self.playback_queue.put_nowait(stereo_buffer)
+        self.stereo_buffer[:, 0] = self.left.read(ctx)
+        self.stereo_buffer[:, 1] = self.right.read(ctx)
+        self.ring_buffer.write(self.stereo_buffer)
+
+    def teardown(self) -> None:
+        self.synchrotron.remove_output_buffer(self.ring_buffer)
+        # Wakes the render thread if it's waiting for room in this buffer
+        self.ring_buffer.close()
+        self.stream.close()
 
 
 class WavFileNode(Node):
     path: DataInput
+    format: DataInput
+    subtype: DataInput
     signal: StreamInput
+    is_sink = True
+
+    # Blocks are copied into chunks of this many frames, which a writer thread writes to disk in one go. If every chunk
+    # is still waiting to be written, blocks are dropped rather than stalling the render thread on a slow disk, unless
+    # rendering offline where nothing is waiting on the render thread.
+    chunk_frames = 16384
+    chunk_count = 8
 
     def __init__(self, synchrotron: Synchrotron, name: str):
         super().__init__(synchrotron, name)
 
-        path = Path(self.path.read(default='output.wav')).resolve()
-        self.file = SoundFile(path, mode='wb', samplerate=synchrotron.sample_rate, channels=1, subtype='FLOAT')
+        self.file: SoundFile | None = None
+        self.writer_thread: Thread | None = None
+        self._free_chunks: Queue[NDArray[np.float32]] = Queue()
+        self._full_chunks: Queue[tuple[NDArray[np.float32], int] | None] = Queue()
+        self._chunk: NDArray[np.float32] | None = None
+        self._chunk_position = 0
+        self.dropped_blocks = 0
+        # Frames still to write before the file ends (when rendering a set length offline), or None to write every block
+        self.frames_left: int | None = None
+
+        self.exports['Backlog'] = 0
+        self.exports['Dropped Blocks'] = 0
+
+    def open(self, channels: int) -> None:
+        from soundfile import SoundFile, check_format
 
+        path = Path(self.path.read(default='output.wav')).resolve()
+        file_format = self.format.read()
+        subtype = self.subtype.read()
+        if subtype is None and check_format(file_format or path.suffix.removeprefix('.'), 'FLOAT'):
+            # Samples are float32 internally, so keep them lossless where the format allows
+            subtype = 'FLOAT'
+        self.file = SoundFile(
+            path,
+            mode='wb',
+            samplerate=self.synchrotron.sample_rate,
+            channels=channels,
+            format=file_format,
+            subtype=subtype,
+        )
         self.exports['File Path'] = path.as_posix()
 
+        for _ in range(self.chunk_count):
+            self._free_chunks.put(np.empty(shape=(self.chunk_frames, channels), dtype=np.float32))
+        self.writer_thread = Thread(target=self._write_chunks, name=f'WavFileWriter-{self.name}', daemon=True)
+        self.writer_thread.start()
+
+    def _write_chunks(self) -> None:
+        while (item := self._full_chunks.get()) is not None:
+            chunk, frames = item
+            self.file.write(chunk[:frames])
+            self._free_chunks.put(chunk)
+            self.exports['Backlog'] = self._full_chunks.qsize()
+
+    def _queue_chunk(self) -> None:
+        if self._chunk is not None and self._chunk_position:
+            self._full_chunks.put((self._chunk, self._chunk_position))
+            self.exports['Backlog'] = self._full_chunks.qsize()
+            self._chunk = None
+            self._chunk_position = 0
+
     def render(self, ctx: RenderContext) -> None:
-        self.file.write(self.signal.read(ctx))
+        # Mono signals are 1D, multichannel ones (channels, frames); either way the file wants (frames, channels)
+        block = np.atleast_2d(self.signal.read(ctx)).T
+        if self.file is None:
+            self.open(channels=block.shape[1])
+        if self.frames_left is not None:
+            block = block[:self.frames_left]
+            self.frames_left -= len(block)
+
+        position = 0
+        while position < len(block):
+            if self._chunk is None:
+                try:
+                    self._chunk = self._free_chunks.get(block=not self.synchrotron.realtime)
+                except Empty:
+                    self.dropped_blocks += 1
+                    self.exports['Dropped Blocks'] = self.dropped_blocks
+                    return
+
+            frames = min(len(block) - position, self.chunk_frames - self._chunk_position)
+            self._chunk[self._chunk_position:self._chunk_position + frames] = block[position:position + frames]
+            position += frames
+            self._chunk_position += frames
+            if self._chunk_position == self.chunk_frames:
+                self._queue_chunk()
 
     def teardown(self) -> None:
+        if self.file is None:
+            return
+
+        self._queue_chunk()
+        self._full_chunks.put(None)
+        self.writer_thread.join()
         self.file.close()
+
+
+class FilePlayerNode(Node):
+    path: DataInput
+    loop: DataInput
+    out: StreamOutput
+
+    # A read-ahead thread streams the file from disk in chunks of this many frames, keeping up to read_ahead_chunks
+    # of them buffered so the render thread shouldn't have to wait on the disk
+    chunk_frames = 16384
+    read_ahead_chunks = 4
+
+    def __init__(self, synchrotron: Synchrotron, name: str):
+        super().__init__(synchrotron, name)
+
+        self.file: SoundFile | None = None
+        self.ring_buffer: RingBuffer | None = None
+        self.reader_thread: Thread | None = None
+        self.opened_path = None
+        self.read_stalls = 0
+        self.underruns = 0
+        self._frames: NDArray[np.float32] | None = None
+
+        self.exports['Read Stalls'] = 0
+        self.exports['Underruns'] = 0
+
+    def open(self, path: str) -> None:
+        from soundfile import SoundFile
+
+        source = Path(path).resolve()
+        self.file = SoundFile(source)
+        self.opened_path = path
+        self.ring_buffer = RingBuffer(capacity=self.chunk_frames * self.read_ahead_chunks, channels=self.file.channels)
+        self._frames = np.empty(shape=(self.synchrotron.buffer_size, self.file.channels), dtype=np.float32)
+        self.exports['Source File'] = source.as_posix()
+        self.exports['Channels'] = self.file.channels
+        self.exports['Sample Rate'] = self.file.samplerate
+
+        # The reader thread gets its own file and ring buffer, as changing path replaces them without waiting for it
+        self.reader_thread = Thread(
+            target=self._read_ahead, args=(self.file, self.ring_buffer), name=f'FileReader-{self.name}', daemon=True,
+        )
+        self.reader_thread.start()
+
+    def _read_chunk(self, file: SoundFile, ring_buffer: RingBuffer, chunk: NDArray[np.float32]) -> bool:
+        # Returns whether there's more of the file to read
+        frames = 0
+        while True:
+            frames += file.read(out=chunk[frames:]).shape[0]
+            if frames == len(chunk) or not self.loop.read(default=False) or file.frames == 0:
+                break
+            file.seek(0)
+        ring_buffer.write(chunk[:frames])
+        return frames == len(chunk)
+
+    def _read_ahead(self, file: SoundFile, ring_buffer: RingBuffer) -> None:
+        chunk = np.empty(shape=(self.chunk_frames, file.channels), dtype=np.float32)
+        while ring_buffer.wait_writable(len(chunk)) and not ring_buffer.closed:
+            if not self._read_chunk(file, ring_buffer, chunk):
+                break
+        # Closing marks the end of the file, so rendering stops waiting for more
+        ring_buffer.close()
+        file.close()
+
+    def close(self, wait: bool = True) -> None:
+        if self.file is None:
+            return
+
+        # Closing the ring buffer stops the reader thread, which closes the file once it's done with it
+        self.ring_buffer.close()
+        if wait:
+            self.reader_thread.join()
+        self.file = None
+        self.opened_path = None
+
+    def render(self, ctx: RenderContext) -> None:
+        path = self.path.read(default='input.wav')
+        if path != self.opened_path:
+            # In realtime the old reader thread is left to finish by itself, as it could be partway through a read
+            self.close(wait=not self.synchrotron.realtime)
+            self.open(path)
+
+        frames = self._frames
+        if self.ring_buffer.readable < len(frames) and not self.ring_buffer.closed:
+            if self.synchrotron.realtime:
+                # The disk hasn't kept up (or the file's only just been opened), and waiting on it could hold up the
+                # audio device indefinitely, so play what's there and fill the rest of the block with silence
+                self.underruns += 1
+                self.exports['Underruns'] = self.underruns
+            else:
+                # Offline, nothing is waiting on the render, so wait for the disk and come out the same every time
+                self.read_stalls += 1
+                self.exports['Read Stalls'] = self.read_stalls
+                self.ring_buffer.wait_readable(len(frames))
+
+        frames_read = self.ring_buffer.read_into(frames)
+        frames[frames_read:] = 0
+
+        # Mono files play as 1D streams, multichannel files as (channels, frames)
+        if frames.shape[1] == 1:
+            output = self.out.acquire(ctx)
+            output[:] = frames[:, 0]
+        else:
+            output = self.out.acquire(ctx, shape=(frames.shape[1], ctx.buffer_size))
+            output[:] = frames.T
+        self.out.write(output)
+
+    def teardown(self) -> None:
+        self.close()
+
+
+class SampleNode(Node):
+    path: DataInput
+    trigger: EventInput
+    out: StreamOutput
+
+    def __init__(self, synchrotron: Synchrotron, name: str):
+        super().__init__(synchrotron, name)
+
+        self.samples: NDArray[np.float32] | None = None
+        self.loaded_path = None
+        # Frames since the last trigger
+        self.position = 0
+
+    def load(self, path: str) -> None:
+        # Loaded from the synchrotron's shared cache, so every node playing a sample shares one copy
+        self.samples, sample_rate = self.synchrotron.sample_cache.get(path)
+        self.loaded_path = path
+        # Starts past the end, so nothing plays until the first trigger
+        self.position = self.samples.shape[-1]
+        self.exports['Source File'] = Path(path).resolve().as_posix()
+        self.exports['Sample Rate'] = sample_rate
+
+    def render(self, ctx: RenderContext) -> None:
+        path = self.path.read(default='sample.wav')
+        if path != self.loaded_path:
+            self.load(path)
+
+        samples = self.samples
+        length = samples.shape[-1]
+        offsets = self.trigger.read().offsets
+
+        # Position within the sample at each frame, counted from the latest trigger at or before it. Frames before
+        # the first trigger in the block carry on from the previous block.
+        run_starts = np.concatenate(([-self.position], offsets))
+        run_lengths = np.diff(offsets, prepend=0, append=ctx.buffer_size)
+        positions = np.arange(ctx.buffer_size) - np.repeat(run_starts, run_lengths)
+        self.position = min(int(positions[-1]) + 1, length)
+        playing = positions < length
+
+        output = self.out.acquire(ctx, shape=(*samples.shape[:-1], ctx.buffer_size))
+        output.fill(0)
+        output[..., playing] = samples[..., positions[playing]]
+        self.out.write(output)
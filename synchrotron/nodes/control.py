@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from . import ControlInput, ControlOutput, Node, RenderContext
+
+if TYPE_CHECKING:
+    from synchrotron.synchrotron import Synchrotron
+
+__all__ = ['ControlSineNode', 'ControlAddNode', 'ControlMultiplyNode']
+
+
+class ControlSineNode(Node):
+    frequency: ControlInput
+    out: ControlOutput
+
+    def __init__(self, synchrotron: Synchrotron, name: str) -> None:
+        super().__init__(synchrotron, name)
+        self.phase = 0.
+
+    def render(self, ctx: RenderContext) -> None:
+        self.out.write(np.sin(2 * np.pi * self.phase))
+        self.phase += self.frequency.read(ctx) * ctx.buffer_size / ctx.sample_rate
+        self.phase %= 1
+
+
+class ControlAddNode(Node):
+    a: ControlInput
+    b: ControlInput
+    out: ControlOutput
+    pure = True
+
+    def render(self, ctx: RenderContext) -> None:
+        self.out.write(self.a.read(ctx) + self.b.read(ctx))
+
+
+class ControlMultiplyNode(Node):
+    a: ControlInput
+    b: ControlInput
+    out: ControlOutput
+    pure = True
+
+    def render(self, ctx: RenderContext) -> None:
+        self.out.write(self.a.read(ctx) * self.b.read(ctx))
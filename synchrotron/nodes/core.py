@@ -2,8 +2,6 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 
-import numpy as np
-
 from . import DataInput, DataOutput, Node, RenderContext, StreamOutput
 
 if TYPE_CHECKING:
@@ -14,11 +12,22 @@ __all__ = ['DataNode', 'StreamNode']
 
 class DataNode(Node):
     out: DataOutput
+    pure = True
 
     def __init__(self, synchrotron: Synchrotron, name: str, value: float) -> None:
         super().__init__(synchrotron, name)
-        self.value = value
+        self._value = value
+        self.exports['Value'] = value
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    @value.setter
+    def value(self, value: float) -> None:
+        self._value = value
         self.exports['Value'] = value
+        self.synchrotron.invalidate_constants()
 
     def render(self, _: RenderContext) -> None:
         self.out.write(self.value)
@@ -27,6 +36,9 @@ class DataNode(Node):
 class StreamNode(Node):
     data: DataInput
     out: StreamOutput
+    pure = True
 
     def render(self, ctx: RenderContext) -> None:
-        self.out.write(np.full(shape=ctx.buffer_size, fill_value=self.data.read(), dtype=np.float32))
+        buffer = self.out.acquire(ctx)
+        buffer.fill(self.data.read())
+        self.out.write(buffer)
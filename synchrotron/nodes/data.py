@@ -1,18 +1,35 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any
 
 import numpy as np
 
-from . import DataInput, Node, RenderContext, StreamInput, StreamOutput
+from . import (
+    ControlInput,
+    DataInput,
+    EventBuffer,
+    EventInput,
+    EventOutput,
+    Node,
+    PhaseAccumulator,
+    RenderContext,
+    StreamInput,
+    StreamOutput,
+)
 
 if TYPE_CHECKING:
+    from numpy.typing import NDArray
+
     from synchrotron.synchrotron import Synchrotron
 
 __all__ = [
     'UniformRandomNode',
     'AddNode',
     'MultiplyNode',
+    'MixdownNode',
+    'ChannelMergeNode',
+    'ChannelSplitNode',
+    'ChannelSelectNode',
     'DebugNode',
     'SequenceNode',
     'ClockNode',
@@ -21,8 +38,8 @@ __all__ = [
 
 
 class UniformRandomNode(Node):
-    min: StreamInput
-    max: StreamInput
+    min: ControlInput
+    max: ControlInput
     out: StreamOutput
 
     def __init__(self, synchrotron: Synchrotron, name: str) -> None:
@@ -30,31 +47,134 @@ class UniformRandomNode(Node):
         self.rng = np.random.default_rng()
 
     def render(self, ctx: RenderContext) -> None:
-        low = self.min.read(ctx)[0]
-        high = self.max.read(ctx)[0]
-        self.out.write(self.rng.uniform(low=low, high=high, size=ctx.buffer_size).astype(np.float32))
+        low = self.min.read(ctx)
+        high = self.max.read(ctx)
+
+        buffer = self.rng.random(dtype=np.float32, out=self.out.acquire(ctx))
+        buffer *= high - low
+        buffer += low
+        self.out.write(buffer)
+
+
+def _combined_shape(node: Node, a: NDArray[np.float32], b: NDArray[np.float32]) -> tuple[int, ...]:
+    # Either stream may have leading axes (channels or voices), with mono streams broadcast across them
+    try:
+        return np.broadcast_shapes(a.shape, b.shape)
+    except ValueError:
+        raise ValueError(f'cannot combine streams of shapes {a.shape} and {b.shape} in {node.name}') from None
 
 
 class AddNode(Node):
     a: StreamInput
     b: StreamInput
     out: StreamOutput
+    pure = True
 
     def render(self, ctx: RenderContext) -> None:
-        self.out.write(self.a.read(ctx) + self.b.read(ctx))
+        a = self.a.read(ctx)
+        b = self.b.read(ctx)
+        self.out.write(np.add(a, b, out=self.out.acquire(ctx, shape=_combined_shape(self, a, b))))
 
 
 class MultiplyNode(Node):
     a: StreamInput
     b: StreamInput
     out: StreamOutput
+    pure = True
+
+    def render(self, ctx: RenderContext) -> None:
+        a = self.a.read(ctx)
+        b = self.b.read(ctx)
+        self.out.write(np.multiply(a, b, out=self.out.acquire(ctx, shape=_combined_shape(self, a, b))))
+
+
+class MixdownNode(Node):
+    # Sums a stream with leading axes (e.g. the voices from a VoiceAllocatorNode) down to mono, and to stereo with
+    # the voices spread evenly across the stereo field, from all in the centre at 0 to hard left and right at 1
+    input: StreamInput
+    gain: ControlInput
+    spread: ControlInput
+    out: StreamOutput
+    left: StreamOutput
+    right: StreamOutput
+    pure = True
+
+    def __init__(self, synchrotron: Synchrotron, name: str):
+        super().__init__(synchrotron, name)
+        self._weights: NDArray[np.float32] | None = None
+        self._weights_key: tuple[int, float, float] | None = None
+
+    def _get_weights(self, voice_count: int, gain: float, spread: float) -> NDArray[np.float32]:
+        # Mono, left and right gain of each voice, with equal power panning
+        key = (voice_count, gain, spread)
+        if key != self._weights_key:
+            pans = np.linspace(-spread, spread, voice_count) if voice_count > 1 else np.zeros(shape=1)
+            angles = (pans + 1) * np.pi / 4
+            self._weights = (np.stack((np.ones_like(angles), np.cos(angles), np.sin(angles))) * gain).astype(np.float32)
+            self._weights_key = key
+        return self._weights
+
+    def render(self, ctx: RenderContext) -> None:
+        signal = self.input.read(ctx)
+        signal = signal.reshape(-1, signal.shape[-1])
+        weights = self._get_weights(signal.shape[0], self.gain.read(ctx, default_constant=1.), self.spread.read(ctx))
+
+        # Each mix is a single matrix product over the voices, however many there are
+        self.out.write(np.matmul(weights[0], signal, out=self.out.acquire(ctx)))
+        if self.left.connections or self.right.connections:
+            self.left.write(np.matmul(weights[1], signal, out=self.left.acquire(ctx)))
+            self.right.write(np.matmul(weights[2], signal, out=self.right.acquire(ctx)))
+
+
+class ChannelMergeNode(Node):
+    # Stacks the channels of b after those of a, so two mono streams make a stereo one
+    a: StreamInput
+    b: StreamInput
+    out: StreamOutput
+    pure = True
 
     def render(self, ctx: RenderContext) -> None:
-        self.out.write(self.a.read(ctx) * self.b.read(ctx))
+        a = np.atleast_2d(self.a.read(ctx))
+        b = np.atleast_2d(self.b.read(ctx))
+        output = self.out.acquire(ctx, shape=(a.shape[0] + b.shape[0], ctx.buffer_size))
+        self.out.write(np.concatenate((a, b), out=output))
+
+
+class ChannelSplitNode(Node):
+    # Splits a stereo stream into mono left and right streams, with a mono input going to both
+    input: StreamInput
+    left: StreamOutput
+    right: StreamOutput
+    pure = True
+
+    def render(self, ctx: RenderContext) -> None:
+        # Copied rather than passed on as views, as the input's buffer is recycled once this node has read it
+        signal = self.input.read(ctx, channels=2)
+        for channel, output in enumerate((self.left, self.right)):
+            buffer = output.acquire(ctx)
+            np.copyto(buffer, signal[channel])
+            output.write(buffer)
+
+
+class ChannelSelectNode(Node):
+    input: StreamInput
+    channel: DataInput
+    out: StreamOutput
+    pure = True
+
+    def render(self, ctx: RenderContext) -> None:
+        signal = np.atleast_2d(self.input.read(ctx))
+        channel = int(self.channel.read(default=0))
+        if not -signal.shape[0] <= channel < signal.shape[0]:
+            raise ValueError(f'channel {channel} out of range for a {signal.shape[0]} channel stream')
+        output = self.out.acquire(ctx)
+        np.copyto(output, signal[channel])
+        self.out.write(output)
 
 
 class DebugNode(Node):
     input: DataInput
+    is_sink = True
 
     def render(self, _: RenderContext) -> None:
         if self.input.connection is None:
@@ -65,7 +185,7 @@ class DebugNode(Node):
 
 class SequenceNode(Node):
     sequence: DataInput
-    step: StreamInput
+    step: EventInput
     out: StreamOutput
 
     def __init__(self, synchrotron: Synchrotron, name: str):
@@ -73,59 +193,220 @@ class SequenceNode(Node):
         self.sequence_position = 0
 
     def render(self, ctx: RenderContext) -> None:
-        step = self.step.read(ctx)
-        output = np.empty(shape=ctx.buffer_size, dtype=np.float32)
-        sequence = self.sequence.read()
+        offsets = self.step.read().offsets
+        sequence = np.asarray(self.sequence.read(), dtype=np.float32)
 
-        for i in range(ctx.buffer_size):
-            if step[i]:
-                self.sequence_position += 1
-                self.sequence_position %= len(sequence)
-            output[i] = sequence[self.sequence_position]
+        # Every step event advances the position, effective from its offset onwards, so the block is a run of
+        # positions between consecutive steps
+        positions = np.arange(self.sequence_position, self.sequence_position + len(offsets) + 1)
+        positions %= len(sequence)
+        self.sequence_position = int(positions[-1])
+        run_lengths = np.diff(offsets, prepend=0, append=ctx.buffer_size)
 
-        self.out.write(output)
+        self.out.write(np.take(sequence, np.repeat(positions, run_lengths), out=self.out.acquire(ctx)))
 
 
 class ClockNode(Node):
     frequency: StreamInput
-    out: StreamOutput
+    out: EventOutput
 
     def __init__(self, synchrotron: Synchrotron, name: str):
         super().__init__(synchrotron, name)
-        self.count = 0
+        self.phase = PhaseAccumulator()
 
     def render(self, ctx: RenderContext) -> None:
-        frequency = self.frequency.read(ctx)
-        output = np.zeros(shape=ctx.buffer_size, dtype=np.bool)
-
-        for i in range(ctx.buffer_size):
-            period = 1 / frequency[i]
-            self.count += frequency[i] / ctx.sample_rate
-            if self.count > period:
-                output[i] = True
-                self.count %= period
-
-        # noinspection PyTypeChecker
-        # TODO: hopefully can fix soon:tm:
-        self.out.write(output)
+        # Ticks every sample_rate / frequency² samples, so the phase runs at frequency² cycles a second, wrapping
+        # once per tick
+        rates = np.square(self.frequency.read(ctx), dtype=np.float64)
+        phases = self.phase.advance(rates, ctx.sample_rate)
+
+        # A tick is wherever the phase wraps on its way to the next sample, and every sample once it's wrapping by a
+        # whole cycle or more each time
+        next_phases = np.append(phases[1:], self.phase.phase)
+        ticks = np.flatnonzero((next_phases < phases) | (rates >= ctx.sample_rate))
+        self.out.write(EventBuffer.from_offsets(ctx.buffer_size, ticks.astype(np.int32)))
 
 
 class TriggerEnvelopeNode(Node):
-    trigger: StreamInput
+    # Attack/decay/sustain/release envelope, with times in seconds for a full-scale change (so releasing from half
+    # level takes half the release time). Triggers restart the attack from the current level. With a gate connected,
+    # rising edges trigger too, and the envelope holds at the sustain level while the gate is high and releases once
+    # it falls. Without a gate, every trigger is a one-shot attack then decay back to zero. Triggers on channels (e.g.
+    # voices from a VoiceAllocatorNode) and (channels, frames) inputs give an envelope per channel.
+    trigger: EventInput
+    gate: StreamInput
     attack: StreamInput
     decay: StreamInput
+    sustain: StreamInput
+    release: StreamInput
     envelope: StreamOutput
 
-    def render(self, ctx: RenderContext) -> None:
-        envelope = np.zeros(shape=ctx.buffer_size, dtype=np.float32)
-        trigger = self.trigger.read(ctx)
-        attack = self.attack.read(ctx)
-        decay = self.decay.read(ctx)
+    def __init__(self, synchrotron: Synchrotron, name: str):
+        super().__init__(synchrotron, name)
+        self._reset(channels=1)
+
+    def _reset(self, channels: int) -> None:
+        self.levels = np.zeros(shape=channels, dtype=np.float32)
+        self.attacking = np.zeros(shape=channels, dtype=np.bool)
+        self.gate_open = np.zeros(shape=channels, dtype=np.bool)
+
+    @staticmethod
+    def _level_totals(times: NDArray, ctx: RenderContext) -> NDArray[np.float32]:
+        # Running total of the per-sample level change for a stage, with a leading zero so the change between any two
+        # positions is a difference of totals. Stages take at least a sample, so a step is never more than full scale.
+        # There's one row per channel, or a single row shared by every channel.
+        totals = np.zeros(shape=(*times.shape[:-1], ctx.buffer_size + 1), dtype=np.float32)
+        np.cumsum(1 / np.maximum(times * ctx.sample_rate, 1), axis=-1, out=totals[..., 1:])
+        return totals.reshape(-1, ctx.buffer_size + 1)
+
+    @staticmethod
+    def _fall(out: NDArray[np.float32], ceiling: Any, totals: NDArray[np.float32], floor: Any) -> None:
+        # Each sample falls one step from the last, but not below the floor. Offset by the stage's totals, that's a
+        # running maximum of the floor from the level before the fall (the ceiling, also offset by its total).
+        if np.ndim(floor) == 0 or floor.shape[-1] == 1:
+            # A constant floor is just a lower bound
+            np.subtract(ceiling, totals, out=out)
+            np.maximum(out, floor, out=out)
+            return
+        peaks = np.maximum.accumulate(floor + totals, axis=-1)
+        np.maximum(peaks, ceiling, out=peaks)
+        np.subtract(peaks, totals, out=out)
 
-        for i in range(ctx.buffer_size):
-            if not trigger[i]:
-                continue
+    def render(self, ctx: RenderContext) -> None:
+        triggers = self.trigger.read()
+        gated = self.gate.connection is not None
+        inputs = [
+            self.attack.read(ctx, default_constant=0.01),
+            self.decay.read(ctx, default_constant=0.2),
+            self.release.read(ctx, default_constant=0.2),
+        ]
+        if gated:
+            inputs += [self.gate.read(ctx), self.sustain.read(ctx, default_constant=0.5)]
+        try:
+            shape = np.broadcast_shapes(triggers.shape, *(buffer.shape for buffer in inputs))
+        except ValueError:
+            raise ValueError(f'envelope inputs of {self.name} have mismatched channels') from None
+        if len(shape) > 2:
+            raise ValueError(f'envelope inputs of {self.name} have too many dimensions')
+
+        channels = shape[0] if len(shape) == 2 else 1
+        if channels != self.levels.size:
+            self._reset(channels)
+        envelope = self.envelope.acquire(ctx, shape=shape)
+        if not gated and not len(triggers) and not self.attacking.any() and not self.levels.any():
+            # Idle, which is most of the time for most voices
+            envelope.fill(0)
+            self.envelope.write(envelope)
+            return
 
-            # TODO: finish this off and add a more elegant way of handling "overflow" into the next buffer?
+        # Stage totals are only worked out for the stages actually rendered this block
+        stage_totals: dict[int, NDArray[np.float32]] = {}
+
+        def level_totals(stage: int, rows: NDArray | slice | int) -> NDArray[np.float32]:
+            totals = stage_totals.get(stage)
+            if totals is None:
+                totals = stage_totals[stage] = self._level_totals(inputs[stage], ctx)
+            if len(totals) == 1:
+                return totals[0] if isinstance(rows, int) else totals
+            return totals[rows]
+
+        # Triggers and gate changes split each channel's block into segments, inside which the envelope is just a
+        # rise to full scale then a fall to its floor
+        is_trigger = np.zeros(shape=(channels, ctx.buffer_size), dtype=np.bool)
+        if triggers.channels is None:
+            is_trigger[:, triggers.offsets] = True
+        else:
+            is_trigger[triggers.channel_indices, triggers.offsets] = True
+        if gated:
+            gate_open = np.broadcast_to(np.atleast_2d(inputs[3] > 0), (channels, ctx.buffer_size))
+            gate_changes = gate_open != np.concatenate((self.gate_open[:, np.newaxis], gate_open[:, :-1]), axis=1)
+            is_trigger |= gate_changes & gate_open
+            self.gate_open = gate_open[:, -1].copy()
+            sustain = np.broadcast_to(np.atleast_2d(inputs[4]), (channels, ctx.buffer_size))
+            # Sustain levels are usually constant, which saves working out falls onto a moving floor
+            sustain_levels = sustain[:, 0] if (inputs[4] == inputs[4][..., :1]).all() else None
+            breakpoints = gate_changes | is_trigger
+        else:
+            breakpoints = is_trigger
+            sustain_levels = None
+        output = envelope.reshape(channels, ctx.buffer_size)
+        busy = breakpoints.any(axis=1) | self.attacking
+
+        # Channels with nothing starting or rising this block are just falling (or holding) all block, so are rendered
+        # together, and those already settled on a constant floor (idle, or sustaining) are simply filled
+        quiet = np.flatnonzero(~busy)
+        if quiet.size:
+            # Views rather than copies in the usual case of every channel being quiet
+            rows = slice(None) if quiet.size == channels else quiet
+            is_open = gate_open[rows, 0] if gated else np.zeros(shape=quiet.size, dtype=np.bool)
+            if is_open.any() and sustain_levels is not None:
+                floor = np.where(is_open, sustain_levels[rows], 0)[:, np.newaxis]
+                floor_start = floor[:, 0]
+                settled = self.levels[rows] == floor_start
+            elif is_open.any():
+                floor = np.where(is_open[:, np.newaxis], sustain[rows], 0)
+                floor_start = floor[:, 0]
+                settled = (floor == floor_start[:, np.newaxis]).all(axis=1) & (self.levels[rows] == floor_start)
+            else:
+                floor = 0
+                floor_start = np.zeros(shape=quiet.size, dtype=np.float32)
+                settled = self.levels[rows] == 0
+
+            output[quiet[settled]] = floor_start[settled, np.newaxis]
+            if not settled.all():
+                falling = quiet[~settled]
+                fall_totals = level_totals(1, falling) if not gated else np.where(
+                    is_open[~settled, np.newaxis], level_totals(1, falling), level_totals(2, falling),
+                )
+                levels = np.empty(shape=(falling.size, ctx.buffer_size), dtype=np.float32)
+                floor = floor if np.ndim(floor) == 0 else floor[~settled]
+                self._fall(levels, self.levels[falling, np.newaxis], fall_totals[:, 1:], floor)
+                output[falling] = levels
+                self.levels[falling] = levels[:, -1]
+
+        # The rest are rendered a segment at a time, on slices between their breakpoints
+        for channel in np.flatnonzero(busy).tolist():
+            level = self.levels[channel].item()
+            attacking = self.attacking[channel].item()
+            attack_row = level_totals(0, channel)
+            fall_rows = (level_totals(2, channel) if gated else None, level_totals(1, channel))
+            offsets = np.flatnonzero(breakpoints[channel]).tolist()
+            starts_triggered = dict(zip(offsets, is_trigger[channel, offsets].tolist(), strict=True))
+            opens = gate_open[channel, [0, *offsets]].tolist() if gated else [True] * (len(offsets) + 1)
+            for start, stop, is_open in zip([0, *offsets], [*offsets, ctx.buffer_size], opens, strict=True):
+                if start == stop:
+                    continue
+                if start in starts_triggered:
+                    # A trigger starts the attack, and the gate closing cuts it short
+                    attacking = starts_triggered[start] or (attacking and is_open)
+                fall_row = fall_rows[is_open]
+                if not gated or not is_open:
+                    floor = 0
+                else:
+                    floor = sustain[channel, start:stop] if sustain_levels is None else sustain_levels[channel]
+                segment = output[channel, start:stop]
+
+                fall_start = start
+                ceiling = level + fall_row[start]
+                if attacking:
+                    # Rising from the current level, until it reaches full scale
+                    base = attack_row[start] - level
+                    peak = int(np.searchsorted(attack_row[start + 1:stop + 1], base + 1))
+                    np.subtract(attack_row[start + 1:start + 1 + peak], base, out=segment[:peak])
+                    if peak == stop - start:
+                        level = segment[-1].item()
+                        continue
+                    segment = segment[peak:]
+                    floor = floor if np.ndim(floor) == 0 else floor[peak:]
+                    fall_start += peak
+                    attacking = False
+                    # Then falling from full scale, starting from the peak itself
+                    ceiling = 1 + fall_row[fall_start + 1]
+
+                self._fall(segment, ceiling, fall_row[fall_start + 1:stop + 1], floor)
+                level = segment[-1].item()
+
+            self.levels[channel] = level
+            self.attacking[channel] = attacking
 
         self.envelope.write(envelope)
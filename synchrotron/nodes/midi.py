@@ -1,69 +1,228 @@
 from __future__ import annotations
 
+from collections import deque
+from pathlib import Path
+from time import perf_counter
 from typing import TYPE_CHECKING
 
 import numpy as np
-from rtmidi import MidiIn
 
-from . import DataInput, MidiBuffer, MidiInput, MidiMessage, MidiOutput, Node, RenderContext, StreamInput, StreamOutput
+from synchrotron.metrics import Histogram
+
+from . import (
+    DataInput,
+    EventBuffer,
+    EventOutput,
+    MidiBuffer,
+    MidiInput,
+    MidiMessage,
+    MidiOutput,
+    Node,
+    RenderContext,
+    StreamInput,
+    StreamOutput,
+)
+from ._midi import MIDI_EVENT_DTYPE
+from ._smf import MidiFile
 
 if TYPE_CHECKING:
+    from numpy.typing import NDArray
+
     from synchrotron.synchrotron import Synchrotron
 
-__all__ = ['MidiInputNode', 'MidiTriggerNode', 'MidiTranspositionNode', 'MonophonicRenderNode']
+__all__ = [
+    'MidiInputNode',
+    'MidiFileNode',
+    'MidiTriggerNode',
+    'MidiTranspositionNode',
+    'MonophonicRenderNode',
+    'VoiceAllocatorNode',
+]
 
 
 class MidiInputNode(Node):
     port: DataInput
     out: MidiOutput
+    is_sink = True
 
     def __init__(self, synchrotron: Synchrotron, name: str):
         super().__init__(synchrotron, name)
+        # Imported here so loading the other MIDI nodes doesn't require the rtmidi backend
+        from rtmidi import MidiIn
+
+        # Timestamped messages from rtmidi's callback thread. Deque appends and pops are atomic, so no lock is needed.
+        self.events: deque[tuple[float, bytes]] = deque()
+        self.latency = Histogram()
+        self.late_events = 0
 
         self.current_port = self.port.read(default=0)
         self.midi_in = MidiIn().open_port(self.current_port)
-        self.last_message_time = 0.
+        self.midi_in.set_callback(self._midi_callback)
 
         self.exports['Available Ports'] = self.midi_in.get_ports()
         self.exports['Selected Port'] = self.midi_in.get_port_name(self.current_port)
+        self.exports['Late Events'] = 0
+
+    def _midi_callback(self, event: tuple[list[int], float], _) -> None:
+        # https://spotlightkid.github.io/python-rtmidi/rtmidi.html#rtmidi.MidiIn.set_callback
+        self.events.append((perf_counter(), bytes(event[0])))
 
     def render(self, ctx: RenderContext) -> None:
         if (new_port := self.port.read()) != self.current_port:
+            self.midi_in.cancel_callback()
             self.midi_in.close_port()
             self.midi_in.open_port(new_port)
+            self.events.clear()
+            self.midi_in.set_callback(self._midi_callback)
             self.current_port = new_port
-            self.last_message_time = 0.
             self.exports['Available Ports'] = self.midi_in.get_ports()
             self.exports['Selected Port'] = self.midi_in.get_port_name(new_port)
 
-        buffer = MidiBuffer(length=ctx.buffer_size)
-
-        while message := self.midi_in.get_message():
-            # https://spotlightkid.github.io/python-rtmidi/rtmidi.html#rtmidi.MidiIn.get_message
-            message: tuple[list[int], float]
+        # Messages are placed at the sample they arrived at relative to the block's start, so the latency is constant
+        # rather than jittering by up to a block. Anything later than the block's end is left for the next block.
+        now = perf_counter()
+        block_end = ctx.block_time + ctx.buffer_size / ctx.sample_rate
+        messages = []
+        while self.events and self.events[0][0] < block_end:
+            timestamp, message = self.events.popleft()
+            offset = int((timestamp - ctx.block_time) * ctx.sample_rate)
+            if offset < 0:
+                # Arrived after its block rendered, e.g. when the block clock has just been resynchronised
+                self.late_events += 1
+                offset = 0
+            messages.append((offset, message))
+            self.latency.observe(now - timestamp)
+
+        if messages:
+            self.exports['Late Events'] = self.late_events
+            self.exports['Input Latency'] = {
+                'mean_ms': round(self.latency.sum / self.latency.count * 1e3, 3),
+                'max_ms': round(self.latency.max * 1e3, 3),
+            }
+        self.out.write(MidiBuffer.from_messages(length=ctx.buffer_size, messages=messages))
+
+    def teardown(self) -> None:
+        self.midi_in.cancel_callback()
+        self.midi_in.close_port()
+
+
+class MidiFileNode(Node):
+    path: DataInput
+    loop: DataInput
+    out: MidiOutput
 
-            self.last_message_time += message[1]
-            sample_offset = int((self.last_message_time * ctx.sample_rate) % ctx.buffer_size)
+    def __init__(self, synchrotron: Synchrotron, name: str):
+        super().__init__(synchrotron, name)
 
-            buffer.add_message(position=sample_offset, message=bytes(message[0]))
+        self.loaded_path = None
+        self.event_samples: NDArray[np.int64] | None = None
+        self.events: NDArray | None = None
+        self.length = 0
+        # Playback starts from the block the file is loaded in, and follows the global clock from there
+        self.start_clock = 0
+        self.expected_clock: int | None = None
+        self.held_notes: set[tuple[int, int]] = set()
+
+    def load(self, path: str, ctx: RenderContext) -> None:
+        midi_file = MidiFile(Path(path).read_bytes())
+        # The tempo map is applied once up front, so playback is just a lookup of events by sample position
+        samples = midi_file.to_samples(np.append(midi_file.events['tick'], midi_file.end_tick), ctx.sample_rate)
+        self.event_samples = samples[:-1]
+        self.events = midi_file.events
+        self.length = max(int(samples[-1]), 1)
+        self.loaded_path = path
+        self.start_clock = ctx.global_clock
+        self.expected_clock = None
+
+        self.exports['MIDI File'] = Path(path).resolve().as_posix()
+        self.exports['Tracks'] = midi_file.track_count
+        self.exports['Events'] = len(self.events)
+        self.exports['Duration'] = round(self.length / ctx.sample_rate, 3)
+
+    def _release_held_notes(self, offset: int) -> NDArray:
+        note_offs = [(offset, MidiMessage.NOTE_OFF | channel, note, 0) for channel, note in sorted(self.held_notes)]
+        self.held_notes.clear()
+        return np.array(note_offs, dtype=MIDI_EVENT_DTYPE)
+
+    def _events_between(self, start: int, stop: int, offset: int) -> NDArray:
+        # Events from sample start (inclusive) to stop (exclusive) of the file, as block events shifted by offset
+        first, last = np.searchsorted(self.event_samples, (start, stop))
+        events = np.empty(shape=last - first, dtype=MIDI_EVENT_DTYPE)
+        events['offset'] = self.event_samples[first:last] - start + offset
+        for field in ('status', 'data1', 'data2'):
+            events[field] = self.events[field][first:last]
+
+        note_ons, note_offs = _note_events(events)
+        for status, note, is_note_on in zip(
+            events['status'][note_ons | note_offs].tolist(),
+            events['data1'][note_ons | note_offs].tolist(),
+            note_ons[note_ons | note_offs].tolist(),
+            strict=True,
+        ):
+            if is_note_on:
+                self.held_notes.add((status & MidiMessage.CHANNEL_MASK, note))
+            else:
+                self.held_notes.discard((status & MidiMessage.CHANNEL_MASK, note))
+        return events
 
-        self.out.write(buffer)
+    def render(self, ctx: RenderContext) -> None:
+        path = self.path.read(default='input.mid')
+        if path != self.loaded_path:
+            self.load(path, ctx)
+
+        # A jump in the global clock is a seek, which would otherwise leave any held notes hanging
+        parts = []
+        if self.expected_clock is not None and ctx.global_clock != self.expected_clock and self.held_notes:
+            parts.append(self._release_held_notes(offset=0))
+        self.expected_clock = ctx.global_clock + ctx.buffer_size
+
+        position = ctx.global_clock - self.start_clock
+        if not self.loop.read(default=False):
+            parts.append(self._events_between(position, position + ctx.buffer_size, offset=0))
+        else:
+            position %= self.length
+            block_offset = 0
+            while True:
+                # Back at the start of the file, so notes held over its end are cut off here
+                if position == 0 and self.held_notes:
+                    parts.append(self._release_held_notes(offset=block_offset))
+                stop = min(position + ctx.buffer_size - block_offset, self.length)
+                parts.append(self._events_between(position, stop, offset=block_offset))
+                block_offset += stop - position
+                if block_offset == ctx.buffer_size:
+                    break
+                position = 0
+
+        events = np.concatenate(parts) if len(parts) > 1 else parts[0]
+        self.out.write(MidiBuffer(length=ctx.buffer_size, events=events))
+
+
+def _note_events(events: NDArray) -> tuple[NDArray[np.bool_], NDArray[np.bool_]]:
+    # Masks of note on and note off events, treating note ons with zero velocity as note offs like MIDI does
+    opcodes = events['status'] & MidiMessage.OPCODE_MASK
+    note_ons = opcodes == MidiMessage.NOTE_ON
+    note_offs = (opcodes == MidiMessage.NOTE_OFF) | (note_ons & (events['data2'] == 0))
+    return note_ons & ~note_offs, note_offs
+
+
+def _note_frequency(note: int | None) -> float:
+    return 0. if note is None else 440 * (2 ** ((note - 69) / 12))
 
 
 class MidiTriggerNode(Node):
     midi: MidiInput
-    trigger: StreamOutput
+    trigger: EventOutput
 
     def render(self, ctx: RenderContext) -> None:
-        output = np.zeros(shape=ctx.buffer_size, dtype=np.bool)
+        # A trigger for every note on, valued by its velocity
+        events = self.midi.read().events
+        if not len(events):
+            self.trigger.write(EventBuffer(length=ctx.buffer_size))
+            return
 
-        for i, messages in self.midi.buffer.data.values():
-            if any(msg[0] & MidiMessage.OPCODE_MASK == MidiMessage.NOTE_ON for msg in messages):
-                output[i] = True
-
-        # noinspection PyTypeChecker
-        # again, typing here needs fixing somehow
-        self.trigger.write(output)
+        note_ons, _ = _note_events(events)
+        velocities = events['data2'][note_ons] / np.float32(127)
+        self.trigger.write(EventBuffer.from_offsets(ctx.buffer_size, events['offset'][note_ons], velocities))
 
 
 class MidiTranspositionNode(Node):
@@ -72,17 +231,22 @@ class MidiTranspositionNode(Node):
     out: MidiOutput
 
     def render(self, ctx: RenderContext) -> None:
-        transposition = self.transposition.read(ctx)
-        output = MidiBuffer(length=ctx.buffer_size)
+        events = self.midi.read().events
+        if not len(events):
+            self.out.write(MidiBuffer(length=ctx.buffer_size))
+            return
 
-        for i in range(ctx.buffer_size):
-            for message in self.midi.buffer.get_messages_at_pos(i):
-                if message[0] & MidiMessage.OPCODE_MASK in (MidiMessage.NOTE_ON, MidiMessage.NOTE_OFF):
-                    transposed = bytearray(message)
-                    transposed[1] += transposition[i]
-                    output.add_message(position=i, message=bytes(transposed))
+        # Notes are shifted by the (rounded) transposition at their offset, and dropped if that takes them out of
+        # MIDI's range; everything else passes straight through
+        note_ons, note_offs = _note_events(events)
+        is_note = note_ons | note_offs
+        transposition = np.rint(self.transposition.read(ctx)[events['offset']]).astype(np.int16)
+        notes = np.where(is_note, events['data1'] + transposition, events['data1'])
+        in_range = (notes >= 0) & (notes <= 127)
 
-        self.out.write(output)
+        output = events[in_range]
+        output['data1'] = notes[in_range]
+        self.out.write(MidiBuffer(length=ctx.buffer_size, events=output))
 
 
 class MonophonicRenderNode(Node):
@@ -94,18 +258,147 @@ class MonophonicRenderNode(Node):
         self.current_note: int | None = None
 
     def render(self, ctx: RenderContext) -> None:
-        output = np.zeros(shape=ctx.buffer_size, dtype=np.float32)
-
-        for i in range(ctx.buffer_size):
-            for message in self.midi.buffer.get_messages_at_pos(i):
-                if message[0] & MidiMessage.OPCODE_MASK == MidiMessage.NOTE_ON:
-                    self.current_note = message[1]
-                elif message[0] & MidiMessage.OPCODE_MASK == MidiMessage.NOTE_OFF:
-                    if message[1] != self.current_note:
-                        continue
+        output = self.frequency.acquire(ctx)
+        output.fill(_note_frequency(self.current_note))
+
+        events = self.midi.read().events
+        if len(events):
+            # Only note events can change the note, and there are few enough of them to walk through in order,
+            # filling the output from each change onwards
+            note_ons, note_offs = _note_events(events)
+            is_note = note_ons | note_offs
+            offsets = events['offset'][is_note].tolist()
+            notes = events['data1'][is_note].tolist()
+            for offset, note, is_note_on in zip(offsets, notes, note_ons[is_note].tolist(), strict=True):
+                if is_note_on:
+                    self.current_note = note
+                elif note == self.current_note:
                     self.current_note = None
-
-            if self.current_note is not None:
-                output[i] = 440 * (2 ** ((self.current_note - 69) / 12))
+                else:
+                    continue
+                output[offset:] = _note_frequency(self.current_note)
 
         self.frequency.write(output)
+
+
+class VoiceAllocatorNode(Node):
+    # Polyphonic counterpart to MonophonicRenderNode, assigning notes to a fixed number of voices. Every output has a
+    # row per voice, shaped (voices, buffer_size), so one chain of nodes downstream renders all the voices at once.
+    # Triggers are events on each voice's channel, valued by velocity. Released voices keep their frequency so
+    # envelopes can ring out, and free voices are reused least recently released first. With every voice busy, a new
+    # note steals one picked by the stealing policy.
+    midi: MidiInput
+    voices: DataInput
+    stealing: DataInput
+    frequency: StreamOutput
+    gate: StreamOutput
+    trigger: EventOutput
+    velocity: StreamOutput
+
+    STEALING_POLICIES = ('oldest', 'newest', 'quietest', 'lowest', 'highest', 'none')
+
+    def __init__(self, synchrotron: Synchrotron, name: str):
+        super().__init__(synchrotron, name)
+        self._allocate(0)
+
+    def _allocate(self, voice_count: int) -> None:
+        # Held note of each voice as (channel << 7) | note, or -1 if the voice is free
+        self.notes = np.full(shape=voice_count, fill_value=-1, dtype=np.int16)
+        self.frequencies = np.zeros(shape=voice_count, dtype=np.float32)
+        self.velocities = np.zeros(shape=voice_count, dtype=np.float32)
+        # When each voice was last started and released, as a count of note events
+        self.started = np.zeros(shape=voice_count, dtype=np.int64)
+        self.released = np.zeros(shape=voice_count, dtype=np.int64)
+        self.event_count = 0
+        self.exports['Voices'] = voice_count
+        self.exports['Stolen Voices'] = 0
+        self.exports['Dropped Notes'] = 0
+
+    def _choose_voice(self, key: int, policy: str) -> int | None:
+        held = np.flatnonzero(self.notes == key)
+        if held.size:
+            # Playing a held note again retriggers its voice rather than doubling it up
+            return int(held[0])
+
+        free = self.notes < 0
+        if free.any():
+            return int(np.argmin(np.where(free, self.released, np.iinfo(np.int64).max)))
+
+        if policy == 'none' or not self.notes.size:
+            self.exports['Dropped Notes'] += 1
+            return None
+        self.exports['Stolen Voices'] += 1
+        pitches = self.notes & 0x7f
+        priority = {
+            'oldest': self.started,
+            'newest': -self.started,
+            'quietest': self.velocities,
+            'lowest': pitches,
+            'highest': -pitches,
+        }[policy]
+        # Ties go to the oldest voice
+        return int(np.lexsort((self.started, priority))[0])
+
+    def render(self, ctx: RenderContext) -> None:
+        voice_count = int(self.voices.read(default=8))
+        policy = self.stealing.read(default='oldest')
+        if policy not in self.STEALING_POLICIES:
+            raise ValueError(f"unknown voice stealing policy '{policy}'")
+        if voice_count != self.notes.size:
+            self._allocate(voice_count)
+
+        shape = (voice_count, ctx.buffer_size)
+        frequency = self.frequency.acquire(ctx, shape=shape)
+        frequency[:] = self.frequencies[:, np.newaxis]
+        gate = self.gate.acquire(ctx, shape=shape)
+        gate[:] = (self.notes >= 0)[:, np.newaxis]
+        trigger_offsets = []
+        trigger_voices = []
+        velocity = self.velocity.acquire(ctx, shape=shape)
+        velocity[:] = self.velocities[:, np.newaxis]
+
+        events = self.midi.read().events
+        if len(events):
+            # As with the monophonic node, note events are walked in order, each filling its voice's row onwards
+            note_ons, note_offs = _note_events(events)
+            is_note = note_ons | note_offs
+            for offset, status, note, note_velocity, is_note_on in zip(
+                events['offset'][is_note].tolist(),
+                events['status'][is_note].tolist(),
+                events['data1'][is_note].tolist(),
+                events['data2'][is_note].tolist(),
+                note_ons[is_note].tolist(),
+                strict=True,
+            ):
+                self.event_count += 1
+                key = (status & MidiMessage.CHANNEL_MASK) << 7 | note
+                if not is_note_on:
+                    for voice in np.flatnonzero(self.notes == key).tolist():
+                        self.notes[voice] = -1
+                        self.released[voice] = self.event_count
+                        gate[voice, offset:] = 0
+                    continue
+
+                voice = self._choose_voice(key, policy)
+                if voice is None:
+                    continue
+                self.notes[voice] = key
+                self.frequencies[voice] = _note_frequency(note)
+                self.velocities[voice] = note_velocity / 127
+                self.started[voice] = self.event_count
+                frequency[voice, offset:] = self.frequencies[voice]
+                gate[voice, offset:] = 1
+                trigger_offsets.append(offset)
+                trigger_voices.append(voice)
+                velocity[voice, offset:] = self.velocities[voice]
+
+        self.frequency.write(frequency)
+        self.gate.write(gate)
+        self.trigger.write(EventBuffer.from_offsets(
+            ctx.buffer_size,
+            np.array(trigger_offsets, dtype=np.int32),
+            velocity[trigger_voices, trigger_offsets],
+            np.array(trigger_voices, dtype=np.int16),
+            channels=voice_count,
+        ))
+        self.velocity.write(velocity)
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+from soundfile import SoundFile
+
+from .nodes import Node, RenderContext, StreamInput
+from .nodes.audio import WavFileNode
+from .scheduler import ParallelScheduler
+from .synchrotron import Synchrotron
+
+
+class PlaybackCaptureNode(Node):
+    # Stand-in for PlaybackNode which records to a stereo file instead of pacing rendering to a sound card
+    signal: StreamInput
+    left: StreamInput
+    right: StreamInput
+    is_sink = True
+
+    def __init__(self, synchrotron: Synchrotron, name: str) -> None:
+        super().__init__(synchrotron, name)
+        self.file: SoundFile | None = None
+        self.stereo_buffer = np.empty(shape=(synchrotron.buffer_size, 2), dtype=np.float32)
+        # Frames still to record before the file ends, or None to record every block
+        self.frames_left: int | None = None
+
+    def open(self, path: Path) -> None:
+        path = path.resolve()
+        self.file = SoundFile(path, mode='w', samplerate=self.synchrotron.sample_rate, channels=2, subtype='FLOAT')
+        self.exports['File Path'] = path.as_posix()
+
+    def render(self, ctx: RenderContext) -> None:
+        # Without a file this acts as a null device, which is still useful for benchmarking
+        if self.signal.connection is not None:
+            np.copyto(self.stereo_buffer, self.signal.read(ctx, channels=2).T)
+        else:
+            self.stereo_buffer[:, 0] = self.left.read(ctx)
+            self.stereo_buffer[:, 1] = self.right.read(ctx)
+        if self.file is not None:
+            frames = self.stereo_buffer
+            if self.frames_left is not None:
+                frames = frames[:self.frames_left]
+                self.frames_left -= len(frames)
+            self.file.write(frames)
+
+    def teardown(self) -> None:
+        if self.file is not None:
+            self.file.close()
+
+
+@dataclass
+class OfflineRenderResult:
+    samples: int
+    sample_rate: int
+    elapsed: float
+    files: list[Path] = field(default_factory=list)
+    warnings: list[str] = field(default_factory=list)
+
+    @property
+    def duration(self) -> float:
+        return self.samples / self.sample_rate
+
+    @property
+    def realtime_factor(self) -> float:
+        return self.duration / self.elapsed if self.elapsed > 0 else math.inf
+
+
+def render_offline(
+    script: str,
+    samples: int,
+    output_directory: Path = Path(),
+    sample_rate: int = 44100,
+    buffer_size: int = 256,
+    workers: int = 0,
+) -> OfflineRenderResult:
+    scheduler = ParallelScheduler(max_workers=workers) if workers > 0 else None
+    synchrotron = Synchrotron(sample_rate=sample_rate, buffer_size=buffer_size, scheduler=scheduler, realtime=False)
+    synchrotron.node_types['PlaybackNode'] = PlaybackCaptureNode
+
+    try:
+        synchrotron.execute(script)
+
+        output_directory.mkdir(parents=True, exist_ok=True)
+        for node in synchrotron.nodes:
+            if isinstance(node, PlaybackCaptureNode):
+                node.open(output_directory / f'{node.name}.wav')
+            # Rendering always happens in whole buffers, so files are cut off at the requested length
+            if isinstance(node, (PlaybackCaptureNode, WavFileNode)):
+                node.frames_left = samples
+
+        block_count = math.ceil(samples / buffer_size)
+        start_time = time.perf_counter()
+        for _ in range(block_count):
+            synchrotron.render_graph()
+        elapsed = time.perf_counter() - start_time
+
+        # Other file writing nodes only open their files once they first render
+        files = [Path(node.exports['File Path']) for node in synchrotron.nodes if 'File Path' in node.exports]
+        # Offline rendering waits on the disk rather than losing audio, so any loss here means something went wrong
+        warnings = [
+            f'{node.name} dropped {node.exports["Dropped Blocks"]} blocks'
+            for node in synchrotron.nodes
+            if node.exports.get('Dropped Blocks')
+        ]
+    finally:
+        synchrotron.shutdown()
+
+    return OfflineRenderResult(
+        samples=samples,
+        sample_rate=sample_rate,
+        elapsed=elapsed,
+        files=files,
+        warnings=warnings,
+    )
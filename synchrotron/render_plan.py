@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+from dataclasses import replace
+from graphlib import TopologicalSorter
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+from .nodes import (
+    ControlInput,
+    ControlOutput,
+    DataInput,
+    DataOutput,
+    EventBuffer,
+    EventInput,
+    EventOutput,
+    MidiInput,
+    MidiOutput,
+    StreamInput,
+    StreamOutput,
+)
+
+if TYPE_CHECKING:
+    from numpy.typing import NDArray
+
+    from .nodes import Input, Node, Output, RenderContext
+
+
+class StreamConversion:
+    # Converts the buffers passing along one connection to the dtype its sink needs, into a buffer owned by the
+    # connection which is reused every block
+    __slots__ = ('dtype', 'buffer')
+
+    def __init__(self, dtype: np.dtype) -> None:
+        self.dtype = dtype
+        self.buffer: NDArray | None = None
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} to {self.dtype}>'
+
+    def convert(self, buffer: NDArray) -> NDArray:
+        if self.buffer is None or self.buffer.shape != buffer.shape:
+            self.buffer = np.empty(shape=buffer.shape, dtype=self.dtype)
+        np.copyto(self.buffer, buffer, casting='same_kind')
+        return self.buffer
+
+
+class EventsToStreamConversion(StreamConversion):
+    # Renders events as a dense stream, zero except for each event's value at its offset
+    __slots__ = ()
+
+    def convert(self, buffer: EventBuffer) -> NDArray:
+        if self.buffer is None or self.buffer.shape != buffer.shape:
+            self.buffer = np.empty(shape=buffer.shape, dtype=self.dtype)
+        return buffer.to_dense(self.buffer)
+
+
+class StreamToEventsConversion:
+    # Turns every non-zero sample of a dense stream into an event
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__}>'
+
+    def convert(self, buffer: NDArray) -> EventBuffer:
+        return EventBuffer.from_dense(buffer)
+
+
+class ConstantToEventsConversion(StreamToEventsConversion):
+    # Turns a data or control value into the events its constant stream would be: one on every sample unless it's zero
+    __slots__ = ('length', 'value', 'events')
+
+    def __init__(self, length: int) -> None:
+        self.length = length
+        self.value: Any = None
+        self.events: EventBuffer | None = None
+
+    def convert(self, buffer: Any) -> EventBuffer:
+        if self.events is None or buffer != self.value:
+            self.events = EventBuffer.from_dense(np.full(shape=self.length, fill_value=buffer or 0, dtype=np.float32))
+            self.value = buffer
+        return self.events
+
+
+def get_conversion(source: Output, sink: Input) -> StreamConversion | StreamToEventsConversion | None:
+    # How a connection's buffers have to be converted for its sink, if at all. Sources the sink can't read are refused
+    # with a ValueError, so this also checks connections before they're made. Data inputs take anything as it is.
+    if isinstance(source, MidiOutput) != isinstance(sink, MidiInput) and not isinstance(sink, DataInput):
+        raise ValueError(f'cannot connect {source.instance_name} ({source.__class__.__name__}) '
+                         f'to {sink.instance_name} ({sink.__class__.__name__})')
+
+    if isinstance(sink, EventInput):
+        if isinstance(source, (ControlOutput, DataOutput)):
+            return ConstantToEventsConversion(sink.node.synchrotron.buffer_size)
+        return StreamToEventsConversion() if isinstance(source, StreamOutput) else None
+    if isinstance(source, EventOutput):
+        if isinstance(sink, StreamInput):
+            return EventsToStreamConversion(sink.dtype)
+        # Control inputs take a stream's first sample, i.e. the value of any event at the start of the block
+        return EventsToStreamConversion(np.dtype(np.float32)) if isinstance(sink, ControlInput) else None
+    if not isinstance(sink, StreamInput):
+        return None
+    dtype = sink.conversion_dtype(source)
+    return None if dtype is None else StreamConversion(dtype)
+
+
+class RenderStep:
+    __slots__ = ('node', 'copies', 'releases')
+
+    def __init__(self, node: Node, rendered_nodes: set[Node]) -> None:
+        self.node = node
+        # Port-to-port buffer copies to perform once the node has rendered, skipping sinks which aren't rendered.
+        # Buffers are passed on as they are, unless the sink needs them converted to another dtype or between events
+        # and dense streams.
+        self.copies: tuple[tuple[Output, Input, StreamConversion | StreamToEventsConversion | None], ...] = tuple(
+            (connection.source, connection.sink, get_conversion(connection.source, connection.sink))
+            for output in node.outputs
+            for connection in output.connections
+            if connection.sink.node in rendered_nodes
+        )
+        # Stream outputs whose buffers are no longer needed by any sink once this step has run
+        self.releases: tuple[StreamOutput, ...] = ()
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} {self.node.name!r} ({len(self.copies)} copies)>'
+
+    def copy_buffers(self) -> None:
+        for source, sink, conversion in self.copies:
+            sink.buffer = source.buffer if conversion is None else conversion.convert(source.buffer)
+
+
+class RenderPlan:
+    # Flat, topologically ordered render steps, only valid for the graph topology it was compiled from
+    def __init__(self, node_dependencies: dict[Node, set[Node]], topology_version: int, version: int) -> None:
+        self.topology_version = topology_version
+        self.version = version
+
+        # Dead node culling: only sinks (nodes with side effects) and everything upstream of them get rendered
+        rendered_nodes: set[Node] = set()
+        pending_nodes = [node for node in node_dependencies if node.is_sink]
+        while pending_nodes:
+            node = pending_nodes.pop()
+            if node not in rendered_nodes:
+                rendered_nodes.add(node)
+                pending_nodes.extend(node_dependencies[node])
+        self.culled_nodes = [node for node in node_dependencies if node not in rendered_nodes]
+        render_order = list(
+            TopologicalSorter({node: node_dependencies[node] for node in rendered_nodes}).static_order()
+        )
+
+        # Constant folding: pure nodes whose inputs are all constant only need rendering when the constants change
+        constant_nodes: set[Node] = set()
+        for node in render_order:
+            if node.pure and node_dependencies[node] <= constant_nodes:
+                constant_nodes.add(node)
+        self.constant_steps = [RenderStep(node, rendered_nodes) for node in render_order if node in constant_nodes]
+        self.constants_version: int | None = None
+        self.steps = [RenderStep(node, rendered_nodes) for node in render_order if node not in constant_nodes]
+
+        # Step indices for schedulers which dispatch steps as soon as their dependencies have rendered
+        step_indices = {step.node: index for index, step in enumerate(self.steps)}
+        self.dependency_counts = [len(node_dependencies[step.node] - constant_nodes) for step in self.steps]
+        self.dependents: list[list[int]] = [[] for _ in self.steps]
+        for step in self.steps:
+            for dependency in node_dependencies[step.node] - constant_nodes:
+                self.dependents[step_indices[dependency]].append(step_indices[step.node])
+        self.roots = [index for index, count in enumerate(self.dependency_counts) if count == 0]
+
+        # Buffer liveness in step order: an output's buffer can be recycled after its last consumer has rendered
+        last_uses: dict[StreamOutput, int] = {}
+        for index, step in enumerate(self.steps):
+            for output in step.node.outputs:
+                if isinstance(output, StreamOutput):
+                    last_uses[output] = index
+            for source, sink, _ in step.copies:
+                if isinstance(source, StreamOutput):
+                    last_uses[source] = max(last_uses[source], step_indices[sink.node])
+
+        releases: list[list[StreamOutput]] = [[] for _ in self.steps]
+        for output, index in last_uses.items():
+            releases[index].append(output)
+        for step, step_releases in zip(self.steps, releases, strict=True):
+            step.releases = tuple(step_releases)
+
+    def __repr__(self) -> str:
+        return (f'<{self.__class__.__name__} v{self.version} '
+                f'({len(self.steps)} steps, {len(self.constant_steps)} constant, {len(self.culled_nodes)} culled)>')
+
+    @property
+    def nodes(self) -> list[Node]:
+        return [step.node for step in (*self.constant_steps, *self.steps)]
+
+    def evaluate_constants(self, ctx: RenderContext, constants_version: int) -> None:
+        # Rendered without a buffer arena, so the cached output buffers belong to the nodes and are never recycled.
+        # Sinks keep the copied buffers until the plan is recompiled, as nothing else writes to their inputs.
+        ctx = replace(ctx, arena=None)
+        for step in self.constant_steps:
+            step.node.render(ctx)
+            step.copy_buffers()
+        self.constants_version = constants_version
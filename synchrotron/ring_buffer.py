@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from threading import Event
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from numpy.typing import NDArray
+
+
+class RingBuffer:
+    # Single-producer, single-consumer FIFO of interleaved float32 frames. The producer only ever advances the write
+    # index and the consumer the read index, so the data path needs no locks. Events are only used to wake a side
+    # which has chosen to wait, so neither side (e.g. an audio callback) is ever blocked by the other.
+    def __init__(self, capacity: int, channels: int) -> None:
+        self.capacity = capacity
+        self.channels = channels
+        self.frames = np.zeros(shape=(capacity, channels), dtype=np.float32)
+        # Total frames written and read, which only ever increase
+        self._write_index = 0
+        self._read_index = 0
+        self._space_available = Event()
+        self._data_available = Event()
+        self.closed = False
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} ({self.readable}/{self.capacity} frames, {self.channels} channels)>'
+
+    @property
+    def readable(self) -> int:
+        return self._write_index - self._read_index
+
+    @property
+    def writable(self) -> int:
+        return self.capacity - self.readable
+
+    def write(self, frames: NDArray[np.float32]) -> int:
+        # Returns the number of frames written, which is less than given if the buffer fills up
+        count = min(len(frames), self.writable)
+        start = self._write_index % self.capacity
+        first_count = min(count, self.capacity - start)
+        self.frames[start:start + first_count] = frames[:first_count]
+        self.frames[:count - first_count] = frames[first_count:count]
+        self._write_index += count
+        if count:
+            self._data_available.set()
+        return count
+
+    def read_into(self, out: NDArray[np.float32]) -> int:
+        # Returns the number of frames read; the rest of out is left untouched
+        count = min(len(out), self.readable)
+        start = self._read_index % self.capacity
+        first_count = min(count, self.capacity - start)
+        out[:first_count] = self.frames[start:start + first_count]
+        out[first_count:count] = self.frames[:count - first_count]
+        self._read_index += count
+        if count:
+            self._space_available.set()
+        return count
+
+    def wait_writable(self, frames: int, timeout: float | None = None) -> bool:
+        # Blocks the producer until there's room for the given number of frames, or the buffer is closed
+        while self.writable < frames and not self.closed:
+            self._space_available.clear()
+            # Checked again after clearing, so a read in between can't be missed
+            if self.writable >= frames or self.closed:
+                break
+            if not self._space_available.wait(timeout):
+                return False
+        return True
+
+    def wait_readable(self, frames: int, timeout: float | None = None) -> bool:
+        # Blocks the consumer until the given number of frames have been written, or the buffer is closed
+        while self.readable < frames and not self.closed:
+            self._data_available.clear()
+            if self.readable >= frames or self.closed:
+                break
+            if not self._data_available.wait(timeout):
+                return False
+        return True
+
+    def clear(self) -> None:
+        # Only safe to call from the consumer, or while it isn't running
+        self._read_index = self._write_index
+        self._space_available.set()
+
+    def close(self) -> None:
+        # Marks the end of writing; anything already written can still be read
+        self.closed = True
+        self._space_available.set()
+        self._data_available.set()
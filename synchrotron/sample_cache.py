@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from numpy.typing import NDArray
+
+
+def _find_wav_data(path: Path) -> int | None:
+    # Byte offset of a RIFF WAVE file's sample data, found by walking its chunks
+    with path.open('rb') as file:
+        header = file.read(12)
+        if header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            return None
+        while len(chunk_header := file.read(8)) == 8:
+            chunk_size = int.from_bytes(chunk_header[4:], 'little')
+            if chunk_header[:4] == b'data':
+                return file.tell()
+            file.seek(chunk_size + (chunk_size & 1), 1)  # Chunks are padded to an even length
+    return None
+
+
+def load_sample(path: Path) -> tuple[NDArray[np.float32], int, bool]:
+    # Returns read-only samples, shaped (frames,) for mono files and (channels, frames) otherwise, along with the
+    # sample rate and whether the samples are memory-mapped rather than loaded
+    import soundfile
+
+    info = soundfile.info(path)
+    if info.format in {'WAV', 'WAVEX'} and info.subtype == 'FLOAT' and info.endian in {'FILE', 'LITTLE'}:
+        offset = _find_wav_data(path)
+        if offset is not None:
+            frames = np.memmap(path, dtype='<f4', mode='r', offset=offset, shape=(info.frames, info.channels))
+            return (frames[:, 0] if info.channels == 1 else frames.T), info.samplerate, True
+
+    frames, sample_rate = soundfile.read(path, dtype='float32', always_2d=True)
+    samples = frames[:, 0].copy() if info.channels == 1 else np.ascontiguousarray(frames.T)
+    samples.flags.writeable = False
+    return samples, sample_rate, False
+
+
+class SampleCache:
+    # Audio files shared between every node which plays them, so many voices of one sample are one copy in memory.
+    # Least recently used samples are evicted once loaded samples take up more than max_bytes. Memory-mapped samples
+    # don't count towards the limit, as the OS pages them in and out of memory as needed.
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._samples: OrderedDict[Path, tuple[tuple[int, int], NDArray[np.float32], int, int]] = OrderedDict()
+        self._lock = Lock()
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} ({len(self._samples)} samples, {self.size_bytes}/{self.max_bytes} bytes)>'
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def get(self, path: str | Path) -> tuple[NDArray[np.float32], int]:
+        # Returns the samples (which must not be written to) and their sample rate
+        path = Path(path).resolve()
+        stat = path.stat()
+        file_version = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._samples.get(path)
+            if entry is not None and entry[0] == file_version:
+                self._samples.move_to_end(path)
+                return entry[1], entry[2]
+            if entry is not None:
+                self._evict(path)
+
+            samples, sample_rate, memory_mapped = load_sample(path)
+            size_bytes = 0 if memory_mapped else samples.nbytes
+            self._samples[path] = (file_version, samples, sample_rate, size_bytes)
+            self.size_bytes += size_bytes
+            # Anything bigger than the whole cache is still returned, just not kept around
+            while self.size_bytes > self.max_bytes and self._samples:
+                self._evict(next(iter(self._samples)))
+            return samples, sample_rate
+
+    def _evict(self, path: Path) -> None:
+        self.size_bytes -= self._samples.pop(path)[3]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._samples.clear()
+            self.size_bytes = 0
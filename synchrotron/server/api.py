@@ -1,5 +1,6 @@
 from fastapi import APIRouter
 from fastapi.requests import Request
+from fastapi.responses import PlainTextResponse
 
 from . import models
 from .dependencies import SynchrotronDependency
@@ -35,6 +36,31 @@ async def export_state(synchrotron: SynchrotronDependency) -> str:
     return synchrotron.export_state()
 
 
+@router.get('/metrics', response_class=PlainTextResponse)
+async def get_metrics(synchrotron: SynchrotronDependency) -> str:
+    return synchrotron.metrics.as_prometheus()
+
+
+@router.get('/metrics/json')
+async def get_metrics_json(synchrotron: SynchrotronDependency) -> dict:
+    return synchrotron.metrics.as_json()
+
+
+@router.get('/metrics/enable')
+async def enable_metrics(synchrotron: SynchrotronDependency) -> None:
+    synchrotron.metrics.enabled = True
+
+
+@router.get('/metrics/disable')
+async def disable_metrics(synchrotron: SynchrotronDependency) -> None:
+    synchrotron.metrics.enabled = False
+
+
+@router.get('/metrics/reset')
+async def reset_metrics(synchrotron: SynchrotronDependency) -> None:
+    synchrotron.metrics.reset()
+
+
 @router.get('/nodes')
 async def get_nodes(synchrotron: SynchrotronDependency) -> list[models.Node]:
     return [models.Node.model_validate(node.as_json()) for node in synchrotron.nodes]
@@ -1,15 +1,70 @@
+from pathlib import Path
+
+import typer
 from typer import Typer
 
 cli = Typer()
 
 
-@cli.command()
-def main(host: str = 'localhost', port: int = 2031):
+@cli.callback(invoke_without_command=True)
+def main(
+    ctx: typer.Context,
+    host: str = 'localhost',
+    port: int = 2031,
+    backend: str = typer.Option(
+        'pyaudio', envvar='SYNCHROTRON_BACKEND', help="Audio output backend: 'pyaudio', or 'null' with no sound card",
+    ),
+    render_ahead: int = typer.Option(
+        2, min=1, help='Blocks to render ahead of the audio device (more is safer but laggier)',
+    ),
+):
+    if ctx.invoked_subcommand is not None:
+        return
+
     import contextlib
 
     import uvicorn
 
+    from synchrotron.backends import get_audio_backend
+
     from . import server
 
+    server.app.state.audio_backend = get_audio_backend(backend)
+    server.app.state.render_ahead = render_ahead
     with contextlib.suppress(KeyboardInterrupt):
         uvicorn.run(server.app, host=host, port=port)
+
+
+@cli.command()
+def render(
+    script: Path,
+    duration: float = typer.Option(10., help='Length of audio to render in seconds'),
+    samples: int | None = typer.Option(None, help='Length of audio to render in samples (overrides --duration)'),
+    output_directory: Path = typer.Option(Path(), help='Directory to write PlaybackNode recordings to'),
+    sample_rate: int = 44100,
+    buffer_size: int = 256,
+    workers: int = typer.Option(0, help='Render independent graph branches on this many threads (0 for serial)'),
+):
+    """Render a Synchrolang script offline, as fast as possible."""
+    from synchrotron.offline import render_offline
+
+    if samples is None:
+        samples = round(duration * sample_rate)
+
+    result = render_offline(
+        script=script.read_text(),
+        samples=samples,
+        output_directory=output_directory,
+        sample_rate=sample_rate,
+        buffer_size=buffer_size,
+        workers=workers,
+    )
+
+    for path in result.files:
+        typer.echo(f'Wrote {path}')
+    for warning in result.warnings:
+        typer.echo(f'Warning: {warning}', err=True)
+    typer.echo(
+        f'Rendered {result.samples} samples ({result.duration:.2f}s of audio) in {result.elapsed:.2f}s '
+        f'- realtime factor {result.realtime_factor:.1f}x'
+    )
@@ -11,7 +11,10 @@ from . import api
 # noinspection PyUnresolvedReferences
 @asynccontextmanager
 async def lifespan(fastapi_app: FastAPI):
-    fastapi_app.state.synchrotron = Synchrotron()
+    fastapi_app.state.synchrotron = Synchrotron(
+        backend=getattr(fastapi_app.state, 'audio_backend', None),
+        render_ahead=getattr(fastapi_app.state, 'render_ahead', 2),
+    )
     yield
     fastapi_app.state.synchrotron.shutdown()
 
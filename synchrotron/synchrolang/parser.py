@@ -2,11 +2,16 @@ from pathlib import Path
 
 from lark import Lark
 
+from synchrotron.cache import get_cache_directory
+
 
 class SynchrolangParser(Lark):
     def __init__(self):
+        # Lark keys the serialised LALR tables on a hash of the grammar and its own version, so stale caches are rebuilt
+        cache_directory = get_cache_directory()
         super().__init__(
             grammar=(Path(__file__).parent / 'synchrolang.lark').read_text(),
             parser='lalr',
             lexer='contextual',
+            cache=False if cache_directory is None else str(cache_directory / 'synchrolang.lark.cache'),
         )
@@ -42,20 +42,21 @@ class SynchrolangTransformer(lark.Transformer):
         return list(elements)
 
     def global_var(self, name: lark.Token) -> Any:
+        # Looked up lazily, as some of these are expensive to evaluate
         global_vars = {
-            'synchrotron': self.synchrotron,
-            'pyaudio': self.synchrotron.pyaudio_session,
-            'clock': self.synchrotron.global_clock,
-            'thread': self.synchrotron.render_thread,
-            'rate': self.synchrotron.sample_rate,
-            'buffer': self.synchrotron.buffer_size,
-            'nodes': self.synchrotron.nodes,
+            'synchrotron': lambda: self.synchrotron,
+            'backend': lambda: self.synchrotron.audio_backend,
+            'clock': lambda: self.synchrotron.global_clock,
+            'thread': lambda: self.synchrotron.render_thread,
+            'rate': lambda: self.synchrotron.sample_rate,
+            'buffer': lambda: self.synchrotron.buffer_size,
+            'nodes': lambda: self.synchrotron.nodes,
         }
 
-        return_obj = global_vars.get(name, ...)
-        if return_obj is ...:
+        getter = global_vars.get(name)
+        if getter is None:
             raise ValueError(f"unknown global variable '{name}'")
-        return return_obj
+        return getter()
 
     # Node instantiation
 
@@ -113,8 +114,7 @@ class SynchrolangTransformer(lark.Transformer):
 
     def create(self, cls: type[Node] | int | float, name: str | None = None) -> Node:
         if name is None:
-            existing_names = {node.name for node in self.synchrotron.nodes}
-            while name is None or name in existing_names:
+            while name is None or self.synchrotron.has_node(name):
                 name = '_' + ''.join(random.choice(string.ascii_lowercase) for _ in range(5))
         else:
             name = str(name)
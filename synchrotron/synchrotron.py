@@ -1,22 +1,38 @@
 from __future__ import annotations
 
 from threading import Event, Thread
+from time import perf_counter
 from typing import TYPE_CHECKING, Any
 
-from graphlib import TopologicalSorter
-from pyaudio import PyAudio
-
 from . import synchrolang
-from .nodes import Connection, Input, Node, Output, Port, RenderContext, get_node_types
+from .backends import AudioBackend, PyAudioBackend
+from .buffer_arena import BufferArena
+from .metrics import RenderMetrics
+from .nodes import Connection, Input, Node, NodeRegistry, Output, Port, RenderContext
 from .nodes.core import DataNode
+from .render_plan import RenderPlan, get_conversion
+from .sample_cache import SampleCache
+from .scheduler import Scheduler, SerialScheduler
 
 if TYPE_CHECKING:
-    from queue import Queue
+    from .ring_buffer import RingBuffer
 
 
 class Synchrotron:
-    def __init__(self, sample_rate: int = 44100, buffer_size: int = 256) -> None:
-        self.pyaudio_session = PyAudio()
+    def __init__(
+        self,
+        sample_rate: int = 44100,
+        buffer_size: int = 256,
+        scheduler: Scheduler | None = None,
+        backend: AudioBackend | None = None,
+        render_ahead: int = 2,
+        realtime: bool = True,
+    ) -> None:
+        if render_ahead < 1:
+            # Output ring buffers hold render_ahead blocks, so rendering would wait forever for room in them
+            raise ValueError(f'render_ahead must be at least 1 block, not {render_ahead}')
+
+        self.audio_backend = PyAudioBackend() if backend is None else backend
         self.global_clock = 0
         self.stop_event = Event()
         self.render_thread: Thread | None = None
@@ -26,33 +42,63 @@ class Synchrotron:
         # It'd be cool to have a dynamic sample rate and buffer size, but it would be such an implementation headache
         self.sample_rate = sample_rate
         self.buffer_size = buffer_size
-
-        self.node_types = {node_type.__name__: node_type for node_type in get_node_types()}
-        self.nodes: list[Node] = []
-        self.connections: list[Connection] = []
+        # Blocks rendered ahead of the audio device: more survives render hiccups, fewer has lower latency
+        self.render_ahead = render_ahead
+        # Whether rendering has to keep up with an audio device, or can wait on things like the disk (rendering offline)
+        self.realtime = realtime
+        self._clock_origin = 0.
+
+        # Node modules (and their dependencies) are only imported once one of their node types is first used
+        self.node_types = NodeRegistry()
+        # Indexed by name and by (source, sink) so lookups stay O(1) in graphs with thousands of nodes
+        self._nodes: dict[str, Node] = {}
+        self._connections: dict[tuple[Output, Input], Connection] = {}
         self._node_dependencies: dict[Node, set[Node]] = {}
-        self._output_queues: list[Queue] = []
+        self._output_buffers: list[RingBuffer] = []
+
+        # Bumped on every topology change; the render plan is recompiled lazily when it falls out of date
+        self._topology_version = 0
+        self._render_plan: RenderPlan | None = None
+        self.render_plan_version = 0
+        # Bumped whenever a constant value in the graph changes, so constant-folded nodes get re-evaluated
+        self._constants_version = 0
+        self.scheduler = SerialScheduler() if scheduler is None else scheduler
+        self.buffer_arena = BufferArena()
+        self.sample_cache = SampleCache()
+        self.metrics = RenderMetrics(deadline=buffer_size / sample_rate)
 
     def get_node_type(self, node_type: str) -> type[Node]:
         if node_type not in self.node_types:
             raise ValueError(f"node type '{node_type}' not found")
         return self.node_types[node_type]
 
+    @property
+    def nodes(self) -> list[Node]:
+        return list(self._nodes.values())
+
+    @property
+    def connections(self) -> list[Connection]:
+        return list(self._connections.values())
+
+    def has_node(self, node_name: str) -> bool:
+        return node_name in self._nodes
+
     def get_node(self, node_name: str) -> Node:
         try:
-            return next(node for node in self.nodes if node.name == node_name)
-        except StopIteration:
+            return self._nodes[node_name]
+        except KeyError:
             raise ValueError(f"node '{node_name}' not found") from None
 
     def add_node(self, node: Node) -> None:
-        if node in self.nodes:
+        name_collision = self._nodes.get(node.name)
+        if name_collision is node:
             raise ValueError(f'node {node!r} already added to graph')
-        name_collision = next((graph_node for graph_node in self.nodes if graph_node.name == node.name), None)
         if name_collision is not None:
             raise ValueError(f'node {node!r} has a duplicate name with node {name_collision.name}')
 
-        self.nodes.append(node)
+        self._nodes[node.name] = node
         self._node_dependencies[node] = set()
+        self.invalidate_render_plan()
 
     def remove_node(self, node_name: str) -> Node:
         node = self.get_node(node_name)
@@ -65,17 +111,19 @@ class Synchrotron:
             for connection in output_port.connections:
                 self.remove_connection(output_port, connection.sink)
 
-        self.nodes.remove(node)
+        del self._nodes[node.name]
         self._node_dependencies.pop(node, None)
+        self.metrics.forget_node(node)
+        self.invalidate_render_plan()
 
         node.teardown()
 
         return node
 
     def get_connection(self, source: Output, sink: Input, return_disconnected: bool = False) -> Connection:
-        for connection in self.connections:
-            if connection.source == source and connection.sink == sink:
-                return connection
+        connection = self._connections.get((source, sink))
+        if connection is not None:
+            return connection
 
         if return_disconnected:
             return Connection(source, sink)
@@ -86,16 +134,20 @@ class Synchrotron:
         if connection.is_connected:
             return connection
 
+        # Refuses sources the sink can't read (e.g. MIDI to a stream, or float to bool streams) before anything changes
+        get_conversion(source, sink)
+
         if sink.connection is not None:
             if strict:
                 raise ValueError(f'output {sink.instance_name} is already connected')
             self.remove_connection(sink.connection.source, sink)
 
         connection.is_connected = True
-        source.connections.append(connection)
+        source.attach(connection)
         sink.connection = connection
-        self.connections.append(connection)
+        self._connections[source, sink] = connection
         self._node_dependencies[sink.node].add(source.node)
+        self.invalidate_render_plan()
 
         return connection
 
@@ -106,9 +158,9 @@ class Synchrotron:
             return None
 
         connection.is_connected = False
-        source.connections.remove(connection)
+        source.detach(connection)
         sink.connection = None
-        self.connections.remove(connection)
+        del self._connections[source, sink]
 
         # If sink node has no inputs connected to source node outputs then remove node dependency
         if not any(
@@ -117,6 +169,7 @@ class Synchrotron:
             if input_port.connection is not None
         ):
             self._node_dependencies[sink.node].remove(source.node)
+        self.invalidate_render_plan()
 
         return connection
 
@@ -143,24 +196,69 @@ class Synchrotron:
         tree = self.synchrolang_parser.parse(script)
         return self.synchrolang_transformer.transform(tree)
 
-    def add_output_queue(self, queue: Queue) -> None:
-        self._output_queues.append(queue)
+    def add_output_buffer(self, ring_buffer: RingBuffer) -> None:
+        self._output_buffers.append(ring_buffer)
+
+    def remove_output_buffer(self, ring_buffer: RingBuffer) -> None:
+        self._output_buffers.remove(ring_buffer)
+
+    def invalidate_render_plan(self) -> None:
+        self._topology_version += 1
+
+    def invalidate_constants(self) -> None:
+        self._constants_version += 1
+
+    def get_render_plan(self) -> RenderPlan:
+        plan = self._render_plan
+        if plan is not None and plan.topology_version == self._topology_version:
+            return plan
+
+        # Read the topology version first so a concurrent graph edit results in another recompile next block
+        topology_version = self._topology_version
+        self.render_plan_version += 1
+        plan = RenderPlan(self._node_dependencies, topology_version=topology_version, version=self.render_plan_version)
+        self._render_plan = plan
+        return plan
+
+    def get_block_time(self) -> float:
+        # Wall clock time of the next block's first sample, on an ideal clock running at exactly the sample rate so
+        # timestamped input (like MIDI) lands in blocks without jitter. It runs far enough behind real time that all
+        # of a block's input has arrived by the time it renders, even rendering ahead of the audio device, and is
+        # resynchronised if rendering stalls or runs faster than real time (like offline rendering).
+        period = self.buffer_size / self.sample_rate
+        lag = (self.render_ahead + 2) * period
+        now = perf_counter()
+        block_time = self._clock_origin + self.global_clock / self.sample_rate
+        if not now - lag - 2 * period <= block_time <= now - period:
+            self._clock_origin = now - lag - self.global_clock / self.sample_rate
+            block_time = now - lag
+        return block_time
 
     def render_graph(self) -> None:
         render_context = RenderContext(
             global_clock=self.global_clock,
             sample_rate=self.sample_rate,
             buffer_size=self.buffer_size,
+            arena=self.buffer_arena,
+            block_time=self.get_block_time(),
         )
-        node_graph = TopologicalSorter(self._node_dependencies)
-        for node in node_graph.static_order():
-            node.render(render_context)
-            for output in node.outputs:
-                for connection in output.connections:
-                    connection.sink.buffer = connection.source.buffer
-
-        for queue in self._output_queues:
-            queue.join()
+        plan = self.get_render_plan()
+        if plan.constants_version != self._constants_version:
+            plan.evaluate_constants(render_context, constants_version=self._constants_version)
+
+        metrics = self.metrics if self.metrics.enabled else None
+        start_time = perf_counter()
+        try:
+            self.scheduler.execute(plan, render_context, metrics)
+        finally:
+            self.buffer_arena.release_all()
+
+        if metrics is not None:
+            metrics.observe_block(perf_counter() - start_time)
+            metrics.queue_depth = max((ring_buffer.readable for ring_buffer in self._output_buffers), default=0)
+        # Rendering is paced by the audio devices: wait until every output has room for the next block
+        for ring_buffer in tuple(self._output_buffers):
+            ring_buffer.wait_writable(self.buffer_size)
         self.global_clock += self.buffer_size
 
     def export_state(self) -> str:
@@ -174,6 +272,10 @@ class Synchrotron:
 
         return script
 
+    @property
+    def rendering(self) -> bool:
+        return self.render_thread is not None and self.render_thread.is_alive() and not self.stop_event.is_set()
+
     def start_rendering(self) -> Thread:
         if self.render_thread is not None and self.render_thread.is_alive():
             raise RuntimeError('render thread is already running')
@@ -196,4 +298,5 @@ class Synchrotron:
         self.stop_rendering()
         for node in self.nodes:
             self.remove_node(node.name)
-        self.pyaudio_session.terminate()
+        self.scheduler.shutdown()
+        self.audio_backend.terminate()
@@ -0,0 +1,99 @@
+import time
+
+import numpy as np
+import soundfile
+
+from synchrotron.backends import NullBackend
+from synchrotron.nodes import EventBuffer, EventOutput, Node, RenderContext
+from synchrotron.synchrotron import Synchrotron
+
+
+class TriggerSourceNode(Node):
+    # Stands in for whatever triggers the node under test, whose input is then filled in directly each block
+    events: EventOutput
+
+    def render(self, ctx: RenderContext) -> None:
+        pass
+
+
+def render_context(block: int, buffer_size: int) -> RenderContext:
+    return RenderContext(
+        global_clock=block * buffer_size,
+        sample_rate=44_100,
+        buffer_size=buffer_size,
+        arena=None,
+        block_time=0.,
+    )
+
+
+def test_sample_node_plays_wav_file(tmp_path):
+    path = tmp_path / 'sample.wav'
+    sample = np.linspace(0.5, 1, 100, dtype=np.float32)
+    soundfile.write(path, sample, 44_100, subtype='FLOAT')
+
+    synchrotron = Synchrotron(buffer_size=64, backend=NullBackend())
+    synchrotron.add_node(TriggerSourceNode(synchrotron, 'source'))
+    synchrotron.execute('new SampleNode sampler; link source.events -> sampler.trigger')
+    sampler = synchrotron.get_node('sampler')
+    sampler.path.buffer = str(path)
+
+    output = []
+    for block in range(4):
+        sampler.trigger.buffer = EventBuffer.from_offsets(64, np.array([10] if block == 0 else [], dtype=np.int32))
+        sampler.render(render_context(block, 64))
+        output.append(sampler.out.buffer.copy())
+    output = np.concatenate(output)
+
+    expected = np.zeros(256, dtype=np.float32)
+    expected[10:110] = sample
+    assert np.array_equal(output, expected)
+    assert sampler.exports['Source File'] == path.resolve().as_posix()
+    assert sampler.exports['Sample Rate'] == 44_100
+
+
+def play_file(player: Node, blocks: int, first_block: int = 0, wait: float = 0.) -> np.ndarray:
+    output = []
+    for block in range(first_block, first_block + blocks):
+        time.sleep(wait)
+        player.render(render_context(block, 64))
+        output.append(np.atleast_2d(player.out.buffer.copy()))
+    return np.concatenate(output, axis=1)
+
+
+def test_file_player_reopens_when_path_changes(tmp_path):
+    mono = np.linspace(-1, 1, 200, dtype=np.float32)
+    stereo = np.stack([np.full(300, 0.25), np.full(300, -0.75)], axis=1).astype(np.float32)
+    soundfile.write(tmp_path / 'mono.wav', mono, 44_100, subtype='FLOAT')
+    soundfile.write(tmp_path / 'stereo.wav', stereo, 44_100, subtype='FLOAT')
+
+    # Offline, the player waits on the disk, so every block is exactly the file
+    synchrotron = Synchrotron(buffer_size=64, backend=NullBackend(), realtime=False)
+    synchrotron.execute('new FilePlayerNode player')
+    player = synchrotron.get_node('player')
+    player.path.buffer = str(tmp_path / 'mono.wav')
+    output = play_file(player, blocks=4)
+    assert np.array_equal(output[0, :200], mono)
+    assert not output[0, 200:].any()
+
+    player.path.buffer = str(tmp_path / 'stereo.wav')
+    output = play_file(player, blocks=5, first_block=4)
+    assert np.array_equal(output[:, :300], stereo.T)
+    assert player.exports['Channels'] == 2
+    assert player.exports['Underruns'] == 0
+    synchrotron.shutdown()
+
+
+def test_file_player_never_waits_in_realtime(tmp_path):
+    stereo = np.stack([np.full(300, 0.25), np.full(300, -0.75)], axis=1).astype(np.float32)
+    soundfile.write(tmp_path / 'stereo.wav', stereo, 44_100, subtype='FLOAT')
+
+    # Blocks the reader thread hasn't caught up with yet are silent, but nothing is lost from the file
+    synchrotron = Synchrotron(buffer_size=64, backend=NullBackend())
+    synchrotron.execute('new FilePlayerNode player')
+    player = synchrotron.get_node('player')
+    player.path.buffer = str(tmp_path / 'stereo.wav')
+    output = play_file(player, blocks=20, wait=0.005)
+    assert player.exports['Read Stalls'] == 0
+    played = output[:, output[0] != 0]
+    assert np.array_equal(played, stereo.T)
+    synchrotron.shutdown()
@@ -0,0 +1,30 @@
+import time
+
+import numpy as np
+
+from synchrotron.backends import CaptureBackend
+from synchrotron.synchrotron import Synchrotron
+
+
+def test_non_realtime_capture_takes_every_rendered_block():
+    backend = CaptureBackend(realtime=False)
+    synchrotron = Synchrotron(buffer_size=64, backend=backend)
+    synchrotron.execute('new 0.25 level; new PlaybackNode out; link level.out -> out.left')
+    stream = backend.streams[0]
+
+    blocks = 200
+    for _ in range(blocks):
+        synchrotron.render_graph()
+    assert stream.wait_for_frames(blocks * 64, timeout=5)
+    # Nothing more is taken until another block is rendered
+    time.sleep(0.05)
+
+    try:
+        assert stream.frames_played == blocks * 64
+        captured = stream.captured
+        assert captured.shape == (blocks * 64, 2)
+        assert np.all(captured[:, 0] == 0.25)
+        assert np.all(captured[:, 1] == 0)
+        assert synchrotron.metrics.underruns == 0
+    finally:
+        synchrotron.shutdown()
@@ -0,0 +1,24 @@
+import soundfile
+
+from synchrotron.offline import render_offline
+
+SCRIPT = """new 440 frequency;
+new SineNode sine;
+new PlaybackNode out;
+new WavFileNode writer;
+
+link frequency.out -> sine.frequency;
+link sine.out -> out.left;
+link sine.out -> writer.signal;
+"""
+
+
+def test_render_writes_exact_sample_count(tmp_path, monkeypatch):
+    # The WavFileNode writes to output.wav in the working directory
+    monkeypatch.chdir(tmp_path)
+    # Neither a whole number of blocks nor of the WavFileNode's chunks
+    result = render_offline(SCRIPT, samples=20_000, output_directory=tmp_path, buffer_size=256)
+
+    assert result.samples == 20_000
+    assert soundfile.info(tmp_path / 'out.wav').frames == 20_000
+    assert soundfile.info(tmp_path / 'output.wav').frames == 20_000
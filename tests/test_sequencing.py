@@ -0,0 +1,112 @@
+from copy import copy
+
+import numpy as np
+
+from synchrotron.backends import NullBackend
+from synchrotron.nodes import EventBuffer, EventOutput, Node, RenderContext, StreamOutput
+from synchrotron.synchrotron import Synchrotron
+
+
+class SourceNode(Node):
+    # Stands in for whatever feeds the node under test, whose inputs are then filled in directly each block
+    stream: StreamOutput
+    events: EventOutput
+
+    def render(self, ctx: RenderContext) -> None:
+        pass
+
+
+def render_blocks(node: Node, sample_rate: int, buffer_size: int, blocks: int, feed) -> list:
+    outputs = []
+    for block in range(blocks):
+        feed(block * buffer_size, (block + 1) * buffer_size)
+        ctx = RenderContext(
+            global_clock=block * buffer_size,
+            sample_rate=sample_rate,
+            buffer_size=buffer_size,
+            arena=None,
+            block_time=0.,
+        )
+        node.render(ctx)
+        # Output buffers can be reused across blocks
+        outputs.append(copy(node.out.buffer))
+    return outputs
+
+
+def reference_clock(frequency: np.ndarray, sample_rate: int) -> np.ndarray:
+    # The per-sample loop: the phase advances frequency² / sample_rate cycles a sample, ticking whenever it wraps
+    phase = 0.
+    ticks = np.zeros(len(frequency), dtype=bool)
+    for i in range(len(frequency)):
+        phase += float(frequency[i]) ** 2 / sample_rate
+        if phase >= 1:
+            ticks[i] = True
+            phase %= 1
+    return ticks
+
+
+def clock_ticks(frequency: np.ndarray, sample_rate: int, buffer_size: int) -> np.ndarray:
+    synchrotron = Synchrotron(sample_rate=sample_rate, buffer_size=buffer_size, backend=NullBackend())
+    synchrotron.add_node(SourceNode(synchrotron, 'source'))
+    synchrotron.execute('new ClockNode clock; link source.stream -> clock.frequency')
+    clock = synchrotron.get_node('clock')
+
+    def feed(start: int, stop: int) -> None:
+        clock.frequency.buffer = frequency[start:stop]
+
+    ticks = np.zeros(len(frequency), dtype=bool)
+    outputs = render_blocks(clock, sample_rate, buffer_size, len(frequency) // buffer_size, feed)
+    for block, events in enumerate(outputs):
+        ticks[block * buffer_size + events.offsets] = True
+    return ticks
+
+
+def test_clock_matches_per_sample_loop():
+    rng = np.random.default_rng(0)
+    for sample_rate in (8_000, 44_100):
+        for buffer_size in (1, 7, 64, 256):
+            frames = buffer_size * (4_096 // buffer_size)
+            frequencies = (
+                np.full(frames, rng.uniform(5, 20), dtype=np.float32),
+                np.full(frames, rng.uniform(20, np.sqrt(sample_rate / 3)), dtype=np.float32),
+                np.repeat(rng.uniform(5, 40, frames // 300 + 1), 300)[:frames].astype(np.float32),
+                (30 * (1 + 0.5 * np.sin(np.arange(frames) / rng.uniform(20, 500)))).astype(np.float32),
+                # Dense enough to tick on most samples, and on every sample once past the square root of the rate
+                np.full(frames, np.sqrt(sample_rate) * rng.uniform(0.9, 1), dtype=np.float32),
+                (np.sqrt(sample_rate) * np.linspace(0.9, 1.1, frames)).astype(np.float32),
+            )
+            for frequency in frequencies:
+                expected = reference_clock(frequency, sample_rate)
+                assert expected.any()
+                assert np.array_equal(clock_ticks(frequency, sample_rate, buffer_size), expected)
+
+
+def reference_sequence(sequence: list[float], steps: np.ndarray) -> np.ndarray:
+    position = 0
+    output = np.empty(len(steps), dtype=np.float32)
+    for i in range(len(steps)):
+        if steps[i]:
+            position = (position + 1) % len(sequence)
+        output[i] = sequence[position]
+    return output
+
+
+def test_sequence_matches_per_sample_loop():
+    rng = np.random.default_rng(1)
+    for sequence in ([3.], [1., 2., 3.], [0., 5., -2., 7., 1.]):
+        for buffer_size in (1, 7, 64, 256):
+            frames = buffer_size * (2_048 // buffer_size)
+            for density in (0.002, 0.05, 0.5):
+                steps = rng.random(frames) < density
+
+                synchrotron = Synchrotron(buffer_size=buffer_size, backend=NullBackend())
+                synchrotron.add_node(SourceNode(synchrotron, 'source'))
+                synchrotron.execute('new SequenceNode sequencer; link source.events -> sequencer.step')
+                sequencer = synchrotron.get_node('sequencer')
+                sequencer.sequence.buffer = sequence
+
+                def feed(start: int, stop: int) -> None:
+                    sequencer.step.buffer = EventBuffer.from_offsets(stop - start, np.flatnonzero(steps[start:stop]))
+
+                outputs = render_blocks(sequencer, 44_100, buffer_size, frames // buffer_size, feed)
+                assert np.array_equal(np.concatenate(outputs), reference_sequence(sequence, steps))
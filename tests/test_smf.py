@@ -0,0 +1,66 @@
+from fractions import Fraction
+from math import floor
+
+import numpy as np
+
+from synchrotron.nodes._smf import DEFAULT_TEMPO, MidiFile
+
+
+def variable_length(value: int) -> bytes:
+    encoded = [value & 0x7f]
+    while value := value >> 7:
+        encoded.append(0x80 | (value & 0x7f))
+    return bytes(reversed(encoded))
+
+
+def smf(division: int, tempo_changes: list[tuple[int, int]], note_ticks: list[int]) -> bytes:
+    # Format 1 file with a tempo track and a note track
+    def track(events: list[tuple[int, bytes]]) -> bytes:
+        data = b''
+        tick = 0
+        for event_tick, event in sorted(events, key=lambda item: item[0]):
+            data += variable_length(event_tick - tick) + event
+            tick = event_tick
+        data += b'\x00\xff\x2f\x00'
+        return b'MTrk' + len(data).to_bytes(4, 'big') + data
+
+    tempo_track = track([(tick, b'\xff\x51\x03' + tempo.to_bytes(3, 'big')) for tick, tempo in tempo_changes])
+    note_track = track([(tick, bytes((0x90, 60, 100))) for tick in note_ticks])
+    header = b'MThd' + (6).to_bytes(4, 'big') + (1).to_bytes(2, 'big') + (2).to_bytes(2, 'big')
+    return header + division.to_bytes(2, 'big') + tempo_track + note_track
+
+
+def reference_samples(division: int, tempo_changes: list[tuple[int, int]], tick: int, sample_rate: int) -> int:
+    # Walks the tempo map one change at a time, rounding the exact position half up
+    seconds = Fraction(0)
+    previous_tick, tempo = 0, DEFAULT_TEMPO
+    for change_tick, change_tempo in sorted(tempo_changes):
+        if change_tick > tick:
+            break
+        seconds += Fraction((change_tick - previous_tick) * tempo, 1_000_000 * division)
+        previous_tick, tempo = change_tick, change_tempo
+    seconds += Fraction((tick - previous_tick) * tempo, 1_000_000 * division)
+    return floor(seconds * sample_rate + Fraction(1, 2))
+
+
+def test_to_samples_multiple_tempo_changes():
+    # Ordinary BPM values, which give awkward microsecond tempos
+    bpms = (133, 219, 62, 209, 67, 97, 123, 141, 89, 173)
+    tempo_changes = [(index * 1_777, 60_000_000 // bpm) for index, bpm in enumerate(bpms)]
+    note_ticks = list(range(0, 20_000, 37))
+
+    for division, sample_rate in ((96, 44_100), (480, 48_000), (1_000, 44_100), (1_000, 96_000)):
+        midi_file = MidiFile(smf(division, tempo_changes, note_ticks))
+        samples = midi_file.to_samples(midi_file.events['tick'], sample_rate)
+        expected = [reference_samples(division, tempo_changes, tick, sample_rate) for tick in note_ticks]
+        assert samples.tolist() == expected
+
+
+def test_to_samples_long_file():
+    # Tick counts far into a long file
+    tempo_changes = [(0, 413_793), (1_000_000, 337_078), (5_000_000, 508_474)]
+    note_ticks = [0, 999_999, 1_000_000, 4_321_987, 9_876_543]
+    midi_file = MidiFile(smf(960, tempo_changes, note_ticks))
+    samples = midi_file.to_samples(midi_file.events['tick'], 44_100)
+    assert samples.dtype == np.int64
+    assert samples.tolist() == [reference_samples(960, tempo_changes, tick, 44_100) for tick in note_ticks]